@@ -0,0 +1,179 @@
+"""Check a pointlist before an acquisition and estimate how long it will run.
+
+Flags points outside the stage travel range, duplicates and points closer
+than a minimum distance, and adds up the stage travel and the time for the
+moves, settling and imaging, all over the whole point array at once:
+
+    python acquisition_check.py plate1.xml --exposure 0.2 --channels 3 --report plate1.check.json
+
+Exits with status 1 when the list has errors (points out of range or duplicated).
+"""
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+from pointlist_io import read_pointlist
+from pointlist_ops import close_pairs
+
+# um, the range of the plate selector's offset sliders
+STAGE_LIMITS = {'x': (-57000, 57000), 'y': (-37500, 37500)}
+
+# points closer than this (um) are the same position
+DUPLICATE_DISTANCE = 1.0
+
+# stage and camera model; X and Y move at the same time, each with this profile
+DEFAULT_MODEL = {
+    'speed': 20000.0, # um/s
+    'acceleration': 200000.0, # um/s^2
+    'settle': 0.1, # s after every move
+    'exposure': 0.1, # s per channel
+    'channels': 1,
+    'focus': 0.5, # s of autofocus/PFS per point
+}
+
+# names listed per problem in the report
+MAX_LISTED = 20
+
+
+def parse_stage_limits(text):
+    """'XMIN,XMAX,YMIN,YMAX' (um) -> limits for check_points; an argparse type."""
+    try:
+        x0, x1, y0, y1 = (float(v) for v in text.split(','))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'expected XMIN,XMAX,YMIN,YMAX in um, got {text!r}')
+    return {'x': (min(x0, x1), max(x0, x1)), 'y': (min(y0, y1), max(y0, y1))}
+
+
+def move_times(dx, dy, model=DEFAULT_MODEL):
+    """Seconds for stage moves of dx, dy um (arrays), trapezoidal speed profile per axis."""
+    v, a = model['speed'], model['acceleration']
+    d = np.abs(np.stack([dx, dy]))
+    # short moves never reach full speed
+    t = np.where(d < v * v / a, 2 * np.sqrt(d / a), d / v + v / a)
+    return t.max(axis=0)
+
+
+def _checked(columns, n):
+    if 'checked' not in columns:
+        return np.ones(n, dtype=bool)
+    checked = np.asarray(columns['checked'])
+    if checked.dtype != bool:
+        checked = np.char.lower(checked.astype(str)) != 'false'
+    return checked
+
+
+def check_points(columns, limits=STAGE_LIMITS, min_distance=None, model=None):
+    """Report (a JSON-ready dict) on the points of a pointlist, in the order they will be visited.
+
+    Unchecked points are checked for errors but left out of the travel and
+    time estimate, as NIS skips them. min_distance (um) additionally warns
+    about points that are closer than that without being duplicates.
+    """
+    model = dict(DEFAULT_MODEL, **(model or {}))
+    x = np.asarray(columns['x'], dtype=float)
+    y = np.asarray(columns['y'], dtype=float)
+    n = len(x)
+    names = np.asarray(columns['name'], dtype=object) if 'name' in columns else np.array(
+        [f'P{i + 1:02d}' for i in range(n)], dtype=object)
+    errors, warnings = [], []
+
+    outside = ((x < limits['x'][0]) | (x > limits['x'][1]) |
+               (y < limits['y'][0]) | (y > limits['y'][1]))
+    if outside.any():
+        errors.append(f'{int(outside.sum())} points outside the stage range')
+
+    i, j = close_pairs(x, y, max(DUPLICATE_DISTANCE, min_distance or 0))
+    dist = np.hypot(x[i] - x[j], y[i] - y[j])
+    duplicate = dist < DUPLICATE_DISTANCE
+    # points at the position of an earlier point, however many copies there are
+    n_duplicates = len(np.unique(j[duplicate]))
+    if n_duplicates:
+        errors.append(f'{n_duplicates} points duplicate an earlier point')
+    close = ~duplicate
+    if close.any():
+        warnings.append(f'{int(close.sum())} pairs of points closer than {min_distance:g} um')
+
+    visit = _checked(columns, n)
+    xv, yv = x[visit], y[visit]
+    steps = np.hypot(np.diff(xv), np.diff(yv))
+    moves = float(move_times(np.diff(xv), np.diff(yv), model).sum())
+    settle = float(np.count_nonzero(steps) * model['settle'])
+    imaging = float(len(xv) * (model['exposure'] * model['channels'] + model['focus']))
+    total = moves + settle + imaging
+    if len(xv) < n:
+        warnings.append(f'{n - len(xv)} unchecked points are skipped')
+
+    def pairs(mask):
+        return [[names[a], names[b]] for a, b in zip(i[mask][:MAX_LISTED].tolist(), j[mask][:MAX_LISTED].tolist())]
+
+    return {
+        'points': n,
+        'stage_limits': {axis: list(lim) for axis, lim in limits.items()},
+        'out_of_range': {'count': int(outside.sum()), 'names': names[outside][:MAX_LISTED].tolist()},
+        'duplicates': {'count': n_duplicates, 'pairs': pairs(duplicate)},
+        'too_close': {'count': int(close.sum()), 'min_distance': min_distance, 'pairs': pairs(close)},
+        'travel_um': float(steps.sum()),
+        'longest_move_um': float(steps.max()) if len(steps) else 0.0,
+        'time_s': {'moves': moves, 'settle': settle, 'imaging': imaging, 'total': total},
+        'model': model,
+        'errors': errors,
+        'warnings': warnings,
+    }
+
+
+def format_duration(seconds):
+    minutes = int(round(seconds / 60))
+    if minutes < 60:
+        return f'{seconds:.0f} s' if seconds < 90 else f'{minutes} min'
+    return f'{minutes // 60} h {minutes % 60:02d} min'
+
+
+def format_summary(report):
+    """One line for a status bar, then one line per problem."""
+    lines = [f"{report['points']} points, about {format_duration(report['time_s']['total'])}, "
+             f"{report['travel_um'] / 1000:.1f} mm stage travel"]
+    lines += [f'Error: {e}' for e in report['errors']]
+    lines += [f'Warning: {w}' for w in report['warnings']]
+    return '\n'.join(lines)
+
+
+def report_path(pointlist_path):
+    """Where a tool saves the report for a pointlist: plate1.xml -> plate1.check.json."""
+    base = os.fspath(pointlist_path)
+    for ext in ('.gz', '.xml', '.txt'):
+        if base.endswith(ext):
+            base = base[:-len(ext)]
+    return base + '.check.json'
+
+
+def write_report(report, path):
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('pointlist', help='NIS pointlist XML (.xml or .xml.gz)')
+    parser.add_argument('--report', default=None, help='JSON report to write (default: none)')
+    parser.add_argument('--min-distance', type=float, default=None,
+                        help='warn about points closer than this (um), e.g. the FOV size')
+    parser.add_argument('--stage-limits', type=parse_stage_limits, default=STAGE_LIMITS, metavar='XMIN,XMAX,YMIN,YMAX',
+                        help='stage travel range in um (default: %(default)s)')
+    for key, value in DEFAULT_MODEL.items():
+        parser.add_argument(f'--{key}', type=type(value), default=value, help=f'(default: {value})')
+    args = parser.parse_args(argv)
+
+    model = {key: getattr(args, key) for key in DEFAULT_MODEL}
+    report = check_points(read_pointlist(args.pointlist), limits=args.stage_limits, min_distance=args.min_distance,
+                          model=model)
+    print(format_summary(report))
+    if args.report:
+        write_report(report, args.report)
+    return 1 if report['errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,130 @@
+"""Z from a focus surface fitted to a few measured focus points.
+
+Focus on a handful of positions spread over the plate (or sample) in NIS,
+save them as a pointlist, and every generated point gets the Z of the
+surface through them instead of one constant Z. The surface is a plane
+(least squares) or a thin-plate spline through the points, evaluated for
+all points at once:
+
+    python focus_surface.py focus_points.xml plate1.xml -o plate1_focused.xml
+"""
+import argparse
+import sys
+
+import numpy as np
+
+from pointlist_io import read_pointlist, write_pointlist
+
+KINDS = ('auto', 'plane', 'tps')
+
+# 'auto' uses a spline from this many points on, a plane below
+MIN_TPS_POINTS = 6
+
+# points evaluated per block, to keep the (points x focus points) matrix small
+_BLOCK = 65536
+
+
+def _tps_kernel(r2):
+    # r^2 log r, written with r^2 so no square root is needed; 0 at r = 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(r2 > 0, 0.5 * r2 * np.log(r2), 0.0)
+
+
+class FocusSurface:
+    """Z(x, y) through measured focus points (um); call it with arrays of x and y."""
+
+    def __init__(self, x, y, z, kind='auto', smoothing=0.0):
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        z = np.asarray(z, dtype=float)
+        if kind not in KINDS:
+            raise ValueError(f'unknown surface {kind!r}, expected one of {KINDS}')
+        if not len(z):
+            raise ValueError('no focus points')
+        measured = x, y, z
+        # a position focused more than once counts once, with its mean Z; repeats make the spline singular
+        xy, inverse = np.unique(np.column_stack([x, y]), axis=0, return_inverse=True)
+        inverse = inverse.ravel()
+        x, y = xy[:, 0], xy[:, 1]
+        z = np.bincount(inverse, weights=z) / np.bincount(inverse)
+        if kind == 'auto':
+            kind = 'tps' if len(z) >= MIN_TPS_POINTS else 'plane'
+
+        # centred and scaled coordinates keep the systems well conditioned
+        self.center = np.array([x.mean(), y.mean()])
+        self.scale = max(np.ptp(x), np.ptp(y)) or 1.0
+        self.points = (np.column_stack([x, y]) - self.center) / self.scale
+        self.n_points = len(z)
+
+        P = np.column_stack([np.ones(len(z)), self.points])
+        if len(z) < 3 or np.linalg.matrix_rank(P) < 3:
+            # too few points (or all on a line) to tilt a plane: constant Z
+            kind = 'constant'
+            self.coef = np.array([z.mean(), 0.0, 0.0])
+            self.weights = None
+        elif kind == 'plane':
+            self.coef = np.linalg.lstsq(P, z, rcond=None)[0]
+            self.weights = None
+        else:
+            n = len(z)
+            d2 = ((self.points[:, None, :] - self.points[None, :, :]) ** 2).sum(axis=2)
+            L = np.zeros((n + 3, n + 3))
+            L[:n, :n] = _tps_kernel(d2) + smoothing * np.eye(n)
+            L[:n, n:] = P
+            L[n:, :n] = P.T
+            solution = np.linalg.solve(L, np.concatenate([z, np.zeros(3)]))
+            self.weights, self.coef = solution[:n], solution[n:]
+        self.kind = kind
+        x, y, z = measured
+        self.rms = float(np.sqrt(np.mean((self(x, y) - z) ** 2)))
+
+    def __call__(self, x, y):
+        xy = (np.column_stack([np.ravel(x), np.ravel(y)]).astype(float) - self.center) / self.scale
+        z = self.coef[0] + xy @ self.coef[1:]
+        if self.weights is not None:
+            for start in range(0, len(xy), _BLOCK):
+                block = xy[start:start + _BLOCK]
+                d2 = ((block[:, None, :] - self.points[None, :, :]) ** 2).sum(axis=2)
+                z[start:start + _BLOCK] += _tps_kernel(d2) @ self.weights
+        return z.reshape(np.shape(x))
+
+    def describe(self):
+        names = {'constant': 'constant Z', 'plane': 'plane', 'tps': 'thin-plate spline'}
+        return f'{names[self.kind]} through {self.n_points} focus points (rms {self.rms:.2f} um)'
+
+
+def load_focus_surface(path, kind='auto', smoothing=0.0):
+    """FocusSurface through the (checked) points of a NIS pointlist."""
+    columns = read_pointlist(path)
+    use = columns['checked']
+    return FocusSurface(columns['x'][use], columns['y'][use], columns['z'][use], kind=kind, smoothing=smoothing)
+
+
+def apply_focus(columns, surface):
+    """Columns with z replaced by the surface at each point's x, y."""
+    columns = dict(columns)
+    columns['z'] = surface(np.asarray(columns['x'], dtype=float), np.asarray(columns['y'], dtype=float))
+    return columns
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('focus_points', help='pointlist with the measured focus positions')
+    parser.add_argument('pointlist', help='pointlist whose Z is to be set')
+    parser.add_argument('-o', '--output', required=True, help='pointlist to write')
+    parser.add_argument('--kind', choices=KINDS, default='auto',
+                        help=f'surface type (default: auto, a spline from {MIN_TPS_POINTS} points on)')
+    parser.add_argument('--smoothing', type=float, default=0.0,
+                        help='spline smoothing; > 0 no longer passes exactly through noisy focus points')
+    args = parser.parse_args(argv)
+
+    surface = load_focus_surface(args.focus_points, kind=args.kind, smoothing=args.smoothing)
+    columns = apply_focus(read_pointlist(args.pointlist), surface)
+    n = write_pointlist(args.output, columns, include_z=True)
+    print(f'{surface.describe()}; Z {columns["z"].min():.2f} to {columns["z"].max():.2f} um '
+          f'for {n} points saved to {args.output}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
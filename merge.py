@@ -1,8 +1,274 @@
 import tkinter as tk
-from tkinter import filedialog, messagebox
-import xml.etree.ElementTree as ET
+from tkinter import filedialog, messagebox, ttk
+import argparse
+import glob
 import os
-import pandas as pd
+import queue
+import sys
+import threading
+import time
+import numpy as np
+from pointlist_io import read_pointlist, write_pointlist
+from pointlist_ops import dedupe_points
+from travel_order import order_columns
+from acquisition_check import STAGE_LIMITS, check_points, format_summary, parse_stage_limits, report_path, write_report
+from partition import partition_points, write_stations, format_manifest, manifest_path, station_path
+from focus_surface import load_focus_surface, apply_focus
+
+
+class MergeCancelled(Exception):
+    pass
+
+
+def load_pointlist(filepath):
+    """Columns of one pointlist with every name prefixed by the file's base name."""
+    columns = read_pointlist(filepath)
+    base = os.path.splitext(os.path.basename(filepath))[0]
+    columns["name"] = np.array([f"{base}_{orig_name or f'P{idx+1:02d}'}"
+                                for idx, orig_name in enumerate(columns["name"])], dtype=object)
+    return columns
+
+
+class ParseCache:
+    """Parsed pointlists keyed by path, modification time and size, persisted as one .npz file."""
+
+    KEYS = ("name", "x", "y", "z", "PSF", "checked")
+
+    def __init__(self, path=None):
+        self.path = path
+        self.entries = {}  # absolute path -> (mtime_ns, size, columns)
+        self.dirty = False
+        if path and os.path.exists(path):
+            try:
+                self._load()
+            except Exception:
+                # unreadable or from an older layout: start over, it is only a cache
+                self.entries = {}
+
+    @staticmethod
+    def signature(filepath):
+        st = os.stat(filepath)
+        return st.st_mtime_ns, st.st_size
+
+    def get(self, filepath, signature):
+        entry = self.entries.get(os.path.abspath(filepath))
+        if entry is None or entry[:2] != signature:
+            return None
+        return entry[2]
+
+    def put(self, filepath, signature, columns):
+        self.entries[os.path.abspath(filepath)] = (*signature, columns)
+        self.dirty = True
+
+    def prune(self, filepaths):
+        """Forget files that are no longer part of the merge."""
+        keep = {os.path.abspath(f) for f in filepaths}
+        for key in [key for key in self.entries if key not in keep]:
+            del self.entries[key]
+            self.dirty = True
+
+    def _load(self):
+        with np.load(self.path) as data:
+            paths = data["paths"].tolist()
+            bounds = np.concatenate([[0], np.cumsum(data["counts"])])
+            columns = {key: data[key] for key in self.KEYS}
+            columns["name"] = columns["name"].astype(object)
+            for k, path in enumerate(paths):
+                lo, hi = bounds[k], bounds[k + 1]
+                self.entries[path] = (int(data["mtimes"][k]), int(data["sizes"][k]),
+                                      {key: col[lo:hi] for key, col in columns.items()})
+
+    def save(self):
+        if not self.path or not self.dirty:
+            return
+        paths = list(self.entries)
+        parts = [self.entries[p][2] for p in paths]
+        arrays = {key: np.concatenate([part[key] for part in parts]) if parts else np.empty(0)
+                  for key in self.KEYS}
+        arrays["name"] = arrays["name"].astype(str)
+        # np.savez adds .npz to names without it; write next to the cache and swap it in
+        tmp = self.path + ".tmp.npz"
+        np.savez(tmp, paths=np.array(paths, dtype=str),
+                 mtimes=np.array([self.entries[p][0] for p in paths], dtype=np.int64),
+                 sizes=np.array([self.entries[p][1] for p in paths], dtype=np.int64),
+                 counts=np.array([len(part["x"]) for part in parts], dtype=np.int64),
+                 **arrays)
+        os.replace(tmp, self.path)
+        self.dirty = False
+
+
+def merge_pointlists(paths, jobs=None, progress=None, cancel=None, cache=None):
+    """Parse paths concurrently in a process pool and concatenate them in the given order.
+
+    progress(done, total) is called as files finish; when cancel() returns
+    True the pending files are dropped and MergeCancelled is raised. With a
+    ParseCache only files that changed since they were cached are parsed.
+    """
+    parts = [None] * len(paths)
+    todo = list(range(len(paths)))
+    if cache is not None:
+        signatures = [ParseCache.signature(path) for path in paths]
+        for i, path in enumerate(paths):
+            parts[i] = cache.get(path, signatures[i])
+        todo = [i for i in todo if parts[i] is None]
+    cached = len(paths) - len(todo)
+
+    def finished(i):
+        if cache is not None:
+            cache.put(paths[i], signatures[i], parts[i])
+
+    if jobs == 1 or len(todo) < 2:
+        for done, i in enumerate(todo, cached + 1):
+            if cancel and cancel():
+                raise MergeCancelled()
+            parts[i] = load_pointlist(paths[i])
+            finished(i)
+            if progress:
+                progress(done, len(paths))
+    else:
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = {pool.submit(load_pointlist, paths[i]): i for i in todo}
+            for done, future in enumerate(as_completed(futures), cached + 1):
+                i = futures[future]
+                parts[i] = future.result()
+                finished(i)
+                if progress:
+                    progress(done, len(paths))
+                if cancel and cancel():
+                    for f in futures:
+                        f.cancel()
+                    raise MergeCancelled()
+
+    keys = ["name", "x", "y", "z", "PSF", "checked"]
+    if not parts:
+        merged = {key: np.empty(0, dtype=object if key == "name" else bool if key == "checked" else float) for key in keys}
+        merged["file"] = np.empty(0, dtype=np.intp)
+        return merged
+    merged = {key: np.concatenate([part[key] for part in parts]) for key in keys}
+    # index of the source file, for ordering file by file
+    merged["file"] = np.repeat(np.arange(len(parts)), [len(part["x"]) for part in parts])
+    return merged
+
+
+# how merged points are ordered before writing
+ORDERS = ("input", "travel", "travel-per-file")
+
+
+def order_merged(merged, order="input"):
+    """Points in input order, in the order with the shortest stage travel, or that with each file finished first."""
+    if order == "input":
+        return merged
+    if order not in ORDERS:
+        raise ValueError(f"unknown order {order!r}, expected one of {ORDERS}")
+    groups = merged["file"] if order == "travel-per-file" else None
+    return order_columns(merged, groups=groups)[0]
+
+
+def check_merged(merged, dedupe=None, focus=None, limits=STAGE_LIMITS):
+    """Merged columns with Z from the focus surface (if any) and their acquisition check report."""
+    if focus is not None:
+        merged = apply_focus(merged, focus)
+    return merged, check_points(merged, limits=limits, min_distance=dedupe)
+
+
+def save_merged(merged, report, output, stations=1, precision=None, include_z=False):
+    """Write the report and the merged list, or one list per station; returns the summary.
+
+    Every file is written next to its final name and moved into place, so
+    readers (NIS, a watched folder) never see a half-written list.
+    """
+    write_report(report, report_path(output))
+    summary = format_summary(report)
+    if stations > 1:
+        # each source file stays on one microscope
+        manifest = write_stations(partition_points(merged, stations, groups=merged["file"]), output,
+                                  precision=precision, include_z=include_z)
+        return summary + "\n" + format_manifest(manifest)
+    tmp = output + ".tmp"
+    write_pointlist(tmp, merged, precision=precision, compress=output.endswith(".gz"), include_z=include_z)
+    os.replace(tmp, output)
+    return summary
+
+
+def expand_inputs(patterns):
+    """Files matching the glob patterns, in pattern order, each file once."""
+    files = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True)) or ([pattern] if os.path.isfile(pattern) else [])
+        for f in matches:
+            if f not in files:
+                files.append(f)
+    return files
+
+
+class FolderWatcher:
+    """Keeps a merged pointlist up to date with the pointlists in a directory.
+
+    Each poll() compares the files' paths, modification times and sizes with
+    the last merge; only when something changed are the new or changed files
+    parsed (the rest come from the cache) and the output rewritten.
+    """
+
+    def __init__(self, directory, output, pattern="*.xml", cache_path=None):
+        self.directory = directory
+        self.output = output
+        self.pattern = pattern
+        self.cache = ParseCache(cache_path or os.path.join(directory, ".pointlist_cache.npz"))
+        self.state = None
+
+    def files(self):
+        output = os.path.abspath(self.output)
+        skip = {output, output + ".tmp"}
+        # station lists written next to the output are results too, not inputs
+        stations = station_path(output, 1).rsplit("_station1", 1)[0] + "_station"
+        return [f for f in sorted(glob.glob(os.path.join(self.directory, self.pattern)))
+                if os.path.isfile(f) and os.path.abspath(f) not in skip and not os.path.abspath(f).startswith(stations)]
+
+    def poll(self, jobs=None, dedupe=None, precision=None, cancel=None, order="input", focus=None, stations=1,
+             limits=STAGE_LIMITS):
+        """Merge again if the folder changed, as Merge & Save would.
+
+        Returns (points, duplicates removed, files parsed, report, summary)
+        or None when nothing changed.
+        """
+        files = self.files()
+        state = [(f, ParseCache.signature(f)) for f in files]
+        if state == self.state:
+            return None
+        parsed = sum(self.cache.get(f, sig) is None for f, sig in state)
+        merged = merge_pointlists(files, jobs=jobs, cancel=cancel, cache=self.cache)
+        removed = 0
+        if dedupe:
+            merged, removed = dedupe_points(merged, dedupe)
+        merged, report = check_merged(order_merged(merged, order), dedupe, focus, limits)
+        summary = save_merged(merged, report, self.output, stations, precision, include_z=focus is not None)
+        self.cache.prune(files)
+        self.cache.save()
+        self.state = state
+        return len(merged["x"]), removed, parsed, report, summary
+
+
+def watch_folder(directory, output, interval=5.0, pattern="*.xml", jobs=None, dedupe=None, precision=None,
+                 cache_path=None, order="input", focus=None, stations=1, limits=STAGE_LIMITS, log=print):
+    """Poll directory every interval seconds and rewrite output whenever its pointlists change."""
+    watcher = FolderWatcher(directory, output, pattern=pattern, cache_path=cache_path)
+    while True:
+        try:
+            result = watcher.poll(jobs=jobs, dedupe=dedupe, precision=precision, order=order, focus=focus,
+                                  stations=stations, limits=limits)
+        except (OSError, SyntaxError) as e:
+            # a file vanished or is still being written (ParseError is a SyntaxError): retry next round
+            log(f"skipped this round: {e}")
+            result = None
+        if result is not None:
+            n, removed, parsed, report, summary = result
+            saved = f"saved to {output}" if stations == 1 else f"split into {stations} station lists"
+            log(f"{time.strftime('%H:%M:%S')} {n} points from {len(watcher.state)} files "
+                f"({parsed} parsed, {removed} duplicates removed) {saved}")
+            log(summary)
+        time.sleep(interval)
+
 
 class PointListMergerApp:
     def __init__(self, root):
@@ -36,8 +302,47 @@ class PointListMergerApp:
         tk.Entry(self.right_frame, textvariable=self.output_path_var, width=50).pack(pady=5)
         tk.Button(self.right_frame, text="Save As", command=self.select_output_file).pack()
 
+        dedupe_frame = tk.Frame(self.right_frame)
+        dedupe_frame.pack(pady=5)
+        self.dedupe_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(dedupe_frame, text="Remove points closer than", variable=self.dedupe_var).pack(side=tk.LEFT)
+        self.dedupe_distance_var = tk.StringVar(value="50")
+        tk.Entry(dedupe_frame, textvariable=self.dedupe_distance_var, width=8).pack(side=tk.LEFT)
+        tk.Label(dedupe_frame, text="um").pack(side=tk.LEFT)
+
+        order_frame = tk.Frame(self.right_frame)
+        order_frame.pack(pady=5)
+        tk.Label(order_frame, text="Point order").pack(side=tk.LEFT)
+        self.order_var = tk.StringVar(value=ORDERS[0])
+        ttk.Combobox(order_frame, textvariable=self.order_var, values=ORDERS, state="readonly", width=16).pack(side=tk.LEFT)
+
+        tk.Label(order_frame, text="Microscopes").pack(side=tk.LEFT, padx=(10, 0))
+        self.stations_var = tk.IntVar(value=1)
+        tk.Spinbox(order_frame, from_=1, to=16, textvariable=self.stations_var, width=4).pack(side=tk.LEFT)
+
+        focus_frame = tk.Frame(self.right_frame)
+        focus_frame.pack(pady=5)
+        tk.Button(focus_frame, text="Focus Points...", command=self.select_focus_points).pack(side=tk.LEFT)
+        self.focus_surface = None
+        self.focus_var = tk.StringVar(value="Z as in the input files")
+        tk.Label(focus_frame, textvariable=self.focus_var).pack(side=tk.LEFT, padx=5)
+
         tk.Button(self.right_frame, text="Merge & Save", command=self.merge_and_save).pack(pady=10)
 
+        self.progress = ttk.Progressbar(self.right_frame, length=300, mode="determinate")
+        self.progress.pack(pady=2)
+        self.status_var = tk.StringVar(value="")
+        tk.Label(self.right_frame, textvariable=self.status_var).pack()
+        self.cancel_button = tk.Button(self.right_frame, text="Cancel", command=self.cancel_merge, state=tk.DISABLED)
+        self.cancel_button.pack(pady=5)
+        self.watch_button = tk.Button(self.right_frame, text="Watch Folder...", command=self.toggle_watch)
+        self.watch_button.pack(pady=5)
+
+        self.merge_thread = None
+        self.merge_queue = queue.Queue()
+        self.cancel_event = threading.Event()
+        self.watcher = None
+
     def browse_files(self):
         files = filedialog.askopenfilenames(filetypes=[("XML files", "*.xml")])
         for f in files:
@@ -61,128 +366,240 @@ class PointListMergerApp:
         if path:
             self.output_path_var.set(path)
 
-    # def parse_xml_to_df(self, filepath):
-    #     tree = ET.parse(filepath)
-    #     root = tree.getroot()
-
-    #     # Find all elements that start with "Point" under root -> no_name
-    #     points = []
-    #     base = os.path.splitext(os.path.basename(filepath))[0]
-    #     pointlist_root = root.find("./no_name")
-
-    #     for child in pointlist_root:
-    #         if not child.tag.startswith("Point"):
-    #             continue
-    #         x = float(child.find("dXPosition").attrib["value"])
-    #         y = float(child.find("dYPosition").attrib["value"])
-    #         z = float(child.find("dZPosition").attrib["value"])
-    #         psf = float(child.find("dPFSOffset").attrib["value"])
-    #         points.append({"x": x, "y": y, "z": z, "PSF": psf})
-
-    #     df = pd.DataFrame(points)
-    #     df["name"] = [f"{base}_P{idx+1:02d}" for idx in range(len(df))]
-    #     return df
-    def parse_xml_to_df(self, filepath):
-        tree = ET.parse(filepath)
-        root = tree.getroot()
-
-        points = []
-        base = os.path.splitext(os.path.basename(filepath))[0]
-        pointlist_root = root.find("./no_name")
-
-        for child in pointlist_root:
-            if not child.tag.startswith("Point"):
-                continue
-
-            x = float(child.find("dXPosition").attrib["value"])
-            y = float(child.find("dYPosition").attrib["value"])
-            z = float(child.find("dZPosition").attrib["value"])
-            psf = float(child.find("dPFSOffset").attrib["value"])
-            strname_elem = child.find("strName")
-            orig_name = strname_elem.attrib.get("value", "").strip()
-            checked = child.find("bChecked").attrib.get("value", "true")
-
-            if not orig_name:
-                orig_name = f"P{len(points)+1:02d}"
-
-            full_name = f"{base}_{orig_name}"
-            points.append({
-                "name": full_name,
-                "x": x,
-                "y": y,
-                "z": z,
-                "PSF": psf,
-                "checked": checked
-            })
-
-        return pd.DataFrame(points)
-
-
-    def dataframe_to_xml(self, df):
-        xml_lines = [
-            '<variant version="1.0">',
-            '<no_name runtype="CLxListVariant">',
-            '<bIncludeZ runtype="bool" value="false"/>',
-            '<bPFSEnabled runtype="bool" value="true"/>'
-        ]
-
-        for idx, row in df.iterrows():
-            point_xml = [
-                f'<Point{idx:05d} runtype="NDSetupMultipointListItem">',
-                f'<bChecked runtype="bool" value="{row["checked"]}"/>',
-                f'<strName runtype="CLxStringW" value="{row["name"]}"/>',
-                f'<dXPosition runtype="double" value="{row["x"]}"/>',
-                f'<dYPosition runtype="double" value="{row["y"]}"/>',
-                f'<dZPosition runtype="double" value="{row["z"]}"/>',
-                f'<dPFSOffset runtype="double" value="{row["PSF"]}"/>',
-                '<baUserData runtype="CLxByteArray" value=""/>',
-                f'</Point{idx:05d}>'
-            ]
-            xml_lines.extend(point_xml)
-
-        xml_lines.extend(['</no_name>', '</variant>'])
-        return '\n'.join(xml_lines)
-
-    # def dataframe_to_xml(self, df):
-    #     xml_lines = [
-    #         '<variant version="1.0">',
-    #         '<no_name runtype="CLxListVariant">',
-    #         '<bIncludeZ runtype="bool" value="false"/>',
-    #         '<bPFSEnabled runtype="bool" value="true"/>'
-    #     ]
-
-    #     for idx, row in df.iterrows():
-    #         point_xml = [
-    #             f'<Point{idx:05d} runtype="NDSetupMultipointListItem">',
-    #             '<bChecked runtype="bool" value="true"/>',
-    #             f'<strName runtype="CLxStringW" value="{row["name"]}"/>',
-    #             f'<dXPosition runtype="double" value="{row["x"]}"/>',
-    #             f'<dYPosition runtype="double" value="{row["y"]}"/>',
-    #             f'<dZPosition runtype="double" value="{row["z"]}"/>',
-    #             f'<dPFSOffset runtype="double" value="{row["PSF"]}"/>',
-    #             '<baUserData runtype="CLxByteArray" value=""/>',
-    #             f'</Point{idx:05d}>'
-    #         ]
-    #         xml_lines.extend(point_xml)
-
-    #     xml_lines.extend(['</no_name>', '</variant>'])
-    #     return '\n'.join(xml_lines)
-
     def merge_and_save(self):
         if not self.selected_files:
             messagebox.showerror("Error", "No files selected to merge.")
             return
+        if self.merge_thread is not None:
+            return
+        try:
+            dedupe = self.dedupe_distance()
+        except ValueError:
+            messagebox.showerror("Error", "Duplicate distance must be a number (um).")
+            return
 
-        merged_df = pd.concat([self.parse_xml_to_df(f) for f in self.selected_files], ignore_index=True)
-        output_xml = self.dataframe_to_xml(merged_df)
-
-        with open(self.output_path_var.get(), "w", encoding="utf-8") as f:
-            f.write(output_xml)
+        # parse in a worker thread (which fans out to a process pool); the UI polls the queue
+        self.cancel_event.clear()
+        self.progress["value"] = 0
+        self.progress["maximum"] = len(self.selected_files)
+        self.cancel_button.config(state=tk.NORMAL)
+        self.merge_thread = threading.Thread(
+            target=self._merge_worker, args=(list(self.selected_files), self.output_path_var.get(), dedupe, self.order_var.get(),
+                                                self.stations_var.get()),
+            daemon=True)
+        self.merge_thread.start()
+        self.root.after(100, self._poll_merge)
+
+    def select_focus_points(self):
+        path = filedialog.askopenfilename(filetypes=[("XML files", "*.xml")])
+        if not path:
+            self.focus_surface = None
+            self.focus_var.set("Z as in the input files")
+            return
+        try:
+            self.focus_surface = load_focus_surface(path)
+        except (ValueError, OSError, SyntaxError, np.linalg.LinAlgError) as e:
+            messagebox.showerror("Error", f"Cannot use {path}: {e}")
+            return
+        self.focus_var.set(f"Z: {self.focus_surface.describe()}")
+
+    def dedupe_distance(self):
+        if not self.dedupe_var.get():
+            return None
+        return float(self.dedupe_distance_var.get())
+
+    def toggle_watch(self):
+        if self.watcher is not None:
+            self.watcher = None
+            self.watch_button.config(text="Watch Folder...")
+            self.status_var.set("Stopped watching")
+            return
+        directory = filedialog.askdirectory()
+        if not directory:
+            return
+        self.watcher = FolderWatcher(directory, self.output_path_var.get())
+        self.watch_button.config(text="Stop Watching")
+        self.status_var.set(f"Watching {directory}")
+        self._watch_tick()
 
-        messagebox.showinfo("Success", f"File saved to: {self.output_path_var.get()}")
+    def _watch_tick(self):
+        if self.watcher is None:
+            return
+        if self.merge_thread is None:
+            try:
+                dedupe = self.dedupe_distance()
+            except ValueError:
+                dedupe = None
+            self.merge_thread = threading.Thread(
+                target=self._watch_worker,
+                args=(self.watcher, dedupe, self.order_var.get(), self.focus_surface, self.stations_var.get()),
+                daemon=True)
+            self.merge_thread.start()
+            self.root.after(100, self._poll_merge)
+        self.root.after(5000, self._watch_tick)
+
+    def _watch_worker(self, watcher, dedupe, order, focus, stations):
+        try:
+            self.merge_queue.put(("watched", watcher.poll(dedupe=dedupe, order=order, focus=focus, stations=stations)))
+        except Exception as e:
+            # a file that is still being written is picked up on the next tick
+            self.merge_queue.put(("watch_error", e))
+
+    def _merge_worker(self, files, output_path, dedupe=None, order="input", stations=1):
+        try:
+            merged = merge_pointlists(files,
+                                      progress=lambda done, total: self.merge_queue.put(("progress", done)),
+                                      cancel=self.cancel_event.is_set)
+            removed = 0
+            if dedupe:
+                merged, removed = dedupe_points(merged, dedupe)
+            merged, report = check_merged(order_merged(merged, order), dedupe, self.focus_surface)
+            # written only once the UI has asked about any errors
+            self.merge_queue.put(("checked", (merged, report, output_path, stations, removed)))
+        except MergeCancelled:
+            self.merge_queue.put(("cancelled", None))
+        except Exception as e:
+            self.merge_queue.put(("error", e))
+
+    def _save_worker(self, merged, report, output_path, stations, removed):
+        try:
+            summary = save_merged(merged, report, output_path, stations, include_z=self.focus_surface is not None)
+            if stations > 1:
+                saved = f"{stations} station point lists saved, manifest: {manifest_path(output_path)}"
+            else:
+                saved = f"File saved to: {output_path}"
+            self.merge_queue.put(("done", (saved, len(merged["name"]), removed, report, summary)))
+        except MergeCancelled:
+            self.merge_queue.put(("cancelled", None))
+        except Exception as e:
+            self.merge_queue.put(("error", e))
+
+    def _poll_merge(self):
+        while True:
+            try:
+                kind, value = self.merge_queue.get_nowait()
+            except queue.Empty:
+                self.root.after(100, self._poll_merge)
+                return
+            if kind == "progress":
+                self.progress["value"] = value
+                self.status_var.set(f"Parsed {value}/{self.progress['maximum']} files")
+                continue
+            break
+
+        self.merge_thread = None
+        self.cancel_button.config(state=tk.DISABLED)
+        if kind == "watched":
+            if value is not None:
+                n, removed, parsed, report, summary = value
+                status = f"{time.strftime('%H:%M:%S')} {n} points saved ({parsed} files parsed, {removed} duplicates removed)"
+                if report["errors"]:
+                    status += f", {len(report['errors'])} errors (see the .check.json report)"
+                self.status_var.set(status)
+        elif kind == "checked":
+            merged, report, path, stations, removed = value
+            if report["errors"] and not messagebox.askyesno(
+                    "Pointlist has errors", format_summary(report) + "\n\nSave anyway?"):
+                self.status_var.set("Not saved")
+                return
+            self.status_var.set("Saving...")
+            self.merge_thread = threading.Thread(target=self._save_worker, args=value, daemon=True)
+            self.merge_thread.start()
+            self.root.after(100, self._poll_merge)
+        elif kind == "watch_error":
+            self.status_var.set(f"Waiting for files: {value}")
+        elif kind == "done":
+            saved, n, removed, report, summary = value
+            self.status_var.set(f"{n} points saved, {removed} duplicates removed" if removed else f"{n} points saved")
+            messagebox.showinfo("Success", f"{saved}\n\n{summary}")
+        elif kind == "cancelled":
+            self.status_var.set("Merge cancelled")
+        else:
+            self.status_var.set("Merge failed")
+            messagebox.showerror("Error", f"Merge failed: {value}")
+
+    def cancel_merge(self):
+        self.cancel_event.set()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Merge NIS Elements pointlists (no arguments opens the GUI).")
+    sub = parser.add_subparsers(dest="command")
+    merge_cmd = sub.add_parser("merge", help="merge pointlists without a display")
+    merge_cmd.add_argument("inputs", nargs="+", help="pointlist files or glob patterns, merged in this order")
+    merge_cmd.add_argument("-o", "--output", required=True, help="merged pointlist to write")
+    merge_cmd.add_argument("-j", "--jobs", type=int, default=None, help="worker processes (default: one per CPU)")
+    merge_cmd.add_argument("--precision", type=int, default=None,
+                           help="decimals for coordinates (default: full precision); an output ending in .gz is gzipped")
+    merge_cmd.add_argument("--dedupe", type=float, default=None, metavar="UM",
+                           help="drop points closer than UM to an earlier point (the first one in input order is kept)")
+    merge_cmd.add_argument("--order", choices=ORDERS, default="input",
+                           help="input order, shortest stage travel, or shortest travel finishing each file first")
+    merge_cmd.add_argument("--focus", default=None, metavar="POINTS",
+                           help="pointlist of measured focus positions; Z of every point follows their surface")
+    merge_cmd.add_argument("--stations", type=int, default=1,
+                           help="split into one list per microscope (OUTPUT_station1.xml, ...), whole files each, "
+                                "balanced by estimated run time and in travel order")
+    merge_cmd.add_argument("--stage-limits", type=parse_stage_limits, default=STAGE_LIMITS, metavar="XMIN,XMAX,YMIN,YMAX",
+                           help="stage travel range in um for the check (default: %(default)s)")
+    watch_cmd = sub.add_parser("watch", help="keep a merged pointlist up to date with a folder")
+    watch_cmd.add_argument("directory", help="folder the pointlists are saved to")
+    watch_cmd.add_argument("-o", "--output", required=True, help="merged pointlist to rewrite on every change")
+    watch_cmd.add_argument("--pattern", default="*.xml", help="pointlists to merge, in name order (default: *.xml)")
+    watch_cmd.add_argument("--interval", type=float, default=5.0, help="seconds between checks (default: 5)")
+    watch_cmd.add_argument("--cache", default=None,
+                           help="parse cache file (default: .pointlist_cache.npz in the folder)")
+    watch_cmd.add_argument("-j", "--jobs", type=int, default=None, help="worker processes (default: one per CPU)")
+    watch_cmd.add_argument("--precision", type=int, default=None, help="decimals for coordinates")
+    watch_cmd.add_argument("--dedupe", type=float, default=None, metavar="UM",
+                           help="drop points closer than UM to an earlier point")
+    watch_cmd.add_argument("--order", choices=ORDERS, default="input", help="point order, as for merge")
+    watch_cmd.add_argument("--focus", default=None, metavar="POINTS", help="focus points for Z, as for merge")
+    watch_cmd.add_argument("--stations", type=int, default=1, help="one list per microscope, as for merge")
+    watch_cmd.add_argument("--stage-limits", type=parse_stage_limits, default=STAGE_LIMITS, metavar="XMIN,XMAX,YMIN,YMAX",
+                           help="stage travel range in um for the check, as for merge")
+    args = parser.parse_args(argv)
+
+    if args.command is None:
+        root = tk.Tk()
+        app = PointListMergerApp(root)
+        root.mainloop()
+        return 0
+
+    if args.command == "watch":
+        surface = load_focus_surface(args.focus) if args.focus else None
+        print(f"Watching {args.directory} every {args.interval:g} s, Ctrl+C to stop")
+        try:
+            watch_folder(args.directory, args.output, interval=args.interval, pattern=args.pattern, jobs=args.jobs,
+                         dedupe=args.dedupe, precision=args.precision, cache_path=args.cache, order=args.order,
+                         focus=surface, stations=args.stations, limits=args.stage_limits)
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    files = expand_inputs(args.inputs)
+    if not files:
+        print("No input files matched.", file=sys.stderr)
+        return 1
+    progress = None
+    if sys.stderr.isatty():
+        progress = lambda done, total: print(f"\rparsed {done}/{total}", end="" if done < total else "\n", file=sys.stderr)
+    merged = merge_pointlists(files, jobs=args.jobs, progress=progress)
+    if args.dedupe:
+        merged, removed = dedupe_points(merged, args.dedupe)
+        print(f"{removed} duplicate points closer than {args.dedupe:g} um removed")
+    merged = order_merged(merged, args.order)
+    surface = None
+    if args.focus:
+        surface = load_focus_surface(args.focus)
+        print(f"Z from a {surface.describe()}")
+    merged, report = check_merged(merged, args.dedupe, surface, args.stage_limits)
+    summary = save_merged(merged, report, args.output, args.stations, args.precision, include_z=surface is not None)
+    if args.stations == 1:
+        print(f"{len(merged['name'])} points from {len(files)} files saved to {args.output}")
+    print(summary)
+    return 1 if report["errors"] else 0
 
 # Run the GUI
 if __name__ == "__main__":
-    root = tk.Tk()
-    app = PointListMergerApp(root)
-    root.mainloop()
+    sys.exit(main())
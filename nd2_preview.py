@@ -0,0 +1,379 @@
+"""Lazy access to ND2 overview images for the ROI selector.
+
+The file is opened through bioio's dask path: nothing is decoded when it
+is opened, and reading a plane only reads the chunks of that scene,
+channel, Z and T. Other channels or Z planes can then be shown without
+opening the file again.
+
+Contrast limits come from a histogram filled chunk by chunk while the
+plane is read (constant memory however large the mosaic). 8- and 16-bit
+planes are kept in their own dtype and the limits are applied by the
+viewer's lookup table; other dtypes are scaled to uint16 once. The plane
+is then reduced 2x2 at a time into a pyramid, so a viewer only ever has to
+show about a screenful of pixels.
+
+Multi-point overview scans (one scene per stage position) can be read as
+a single mosaic: every position is put in place from its stage position
+and pixel size, into a canvas backed by a temporary file rather than RAM.
+"""
+import tempfile
+import time
+
+import numpy as np
+
+# samples kept for dtypes without a full histogram (floats, 32-bit integers)
+MAX_SAMPLES = 1 << 20
+
+# rows scaled per step, bounds the temporaries of float images
+_ROWS = 1024
+
+# pyramid levels are halved until the longest side is at most this
+PYRAMID_MIN_SIZE = 512
+
+# scene index that stands for all positions assembled into a mosaic
+MOSAIC = -1
+
+# longest side (pixels) of the coarse previews shown while a plane is read, and how often (s)
+COARSE_SIZE = 1024
+COARSE_INTERVAL = 0.5
+
+# planes larger than this (bytes) are read into temporary files instead of RAM, as mosaics always are
+SCRATCH_BYTES = 256 << 20
+
+
+class OverviewFile:
+    """An ND2 file opened lazily; planes are read one at a time."""
+
+    def __init__(self, path):
+        from bioio import BioImage
+        import bioio_nd2
+
+        self.path = path
+        self.image = BioImage(path, reader=bioio_nd2.Reader)
+        self.scene_index = 0
+
+    @property
+    def scenes(self):
+        return list(self.image.scenes)
+
+    def set_scene(self, index):
+        self.image.set_scene(index)
+        self.scene_index = index
+
+    @property
+    def channel_names(self):
+        names = self.image.channel_names
+        return list(names) if names else [f'Channel {c}' for c in range(self.image.dims.C)]
+
+    @property
+    def n_z(self):
+        return self.image.dims.Z
+
+    @property
+    def n_t(self):
+        return self.image.dims.T
+
+    @property
+    def pixels(self):
+        return self.image.metadata.images[self.scene_index].pixels
+
+    @property
+    def pixel_size(self):
+        """um per pixel."""
+        return self.pixels.physical_size_x
+
+    def plane_metadata(self, c=0, z=0, t=0):
+        """OME plane (position_x/y/z of the stage) of a channel, Z and T, or the first plane."""
+        return _find_plane(self.pixels.planes, c, z, t)
+
+    def positions(self, c=0, z=0, t=0):
+        """Columns (x, y, z in um, height, width in pixels, pixel_size) with one entry per scene."""
+        rows = []
+        for image in self.image.metadata.images:
+            pixels = image.pixels
+            plane = _find_plane(pixels.planes, c, z, t)
+            rows.append((plane.position_x, plane.position_y, plane.position_z,
+                         pixels.size_y, pixels.size_x, pixels.physical_size_x))
+        keys = ('x', 'y', 'z', 'height', 'width', 'pixel_size')
+        return {key: np.array(col) for key, col in zip(keys, zip(*rows))}
+
+    def lazy_plane(self, c=0, z=0, t=0):
+        """The plane as a (Y, X) dask array, nothing read yet."""
+        return self.image.get_image_dask_data('YX', C=c, Z=z, T=t)
+
+    def read_plane(self, c=0, z=0, t=0, progress=None, cancel=None, histogram=None, out=None):
+        """The plane as a (Y, X) array in the file's dtype, read chunk by chunk.
+
+        progress(done, total) is called after each chunk; when cancel()
+        returns True reading stops and None is returned. Each chunk is also
+        added to histogram, if one is given. out can be a preallocated
+        array to read into, e.g. to look at the part read so far.
+        """
+        lazy = self.lazy_plane(c, z, t)
+        if out is None:
+            out = np.empty(lazy.shape, dtype=lazy.dtype)
+        blocks = list(chunk_slices(lazy.chunks))
+        for done, index in enumerate(blocks, 1):
+            if cancel and cancel():
+                return None
+            out[index] = np.asarray(lazy[index])
+            if histogram is not None:
+                histogram.add(out[index])
+            if progress:
+                progress(done, len(blocks))
+        return out
+
+    def read_mosaic(self, layout, c=0, z=0, t=0, progress=None, cancel=None, histogram=None, out=None):
+        """Every scene read into its place in one canvas (see mosaic_layout); otherwise like read_plane.
+
+        Where positions overlap the later one is kept.
+        """
+        rows, cols, heights, widths = layout['rows'], layout['cols'], layout['height'], layout['width']
+        if out is None:
+            out = np.zeros(layout['shape'], dtype=self.lazy_plane(c, z, t).dtype)
+        n = len(rows)
+        for k in range(n):
+            self.set_scene(k)
+
+            def tile_read(done, total, k=k):
+                # assumes the positions have the same number of chunks, as they do in a scan
+                progress(k * total + done, n * total)
+
+            tile = out[rows[k]:rows[k] + heights[k], cols[k]:cols[k] + widths[k]]
+            if self.read_plane(c, z, t, progress=tile_read if progress else None, cancel=cancel,
+                               histogram=histogram, out=tile) is None:
+                return None
+        return out
+
+
+def _find_plane(planes, c, z, t):
+    for plane in planes:
+        if (plane.the_c, plane.the_z, plane.the_t) == (c, z, t):
+            return plane
+    return planes[0]
+
+
+def mosaic_layout(positions):
+    """Where each position goes in one canvas, oriented like a single plane; returns a dict.
+
+    positions are the columns of OverviewFile.positions. The result has the
+    pixel offsets of every position (rows, cols), the canvas shape, and the
+    stage position of the canvas centre and its pixel size, so the canvas
+    maps to the stage exactly like one plane does (up to half a pixel of
+    rounding per position).
+    """
+    size = positions['pixel_size'].astype(float)
+    if not np.allclose(size, size[0], rtol=1e-3):
+        raise ValueError('the positions have different pixel sizes')
+    s = float(size[0])
+    x, y = positions['x'].astype(float), positions['y'].astype(float)
+    h, w = positions['height'].astype(int), positions['width'].astype(int)
+    # stage Y grows with the row; stage X with the displayed x, i.e. towards lower columns
+    rows = np.rint(y / s - h / 2)
+    cols = np.rint(-x / s - w / 2)
+    rows = (rows - rows.min()).astype(int)
+    cols = (cols - cols.min()).astype(int)
+    shape = (int((rows + h).max()), int((cols + w).max()))
+    return dict(positions, rows=rows, cols=cols, shape=shape, pixel_size=s,
+                position_x=float(np.mean(x + (cols + w / 2 - shape[1] / 2) * s)),
+                position_y=float(np.mean(y - (rows + h / 2 - shape[0] / 2) * s)),
+                position_z=float(np.median(positions['z'])))
+
+
+def _scratch(shape, dtype):
+    """Zeroed array backed by an unnamed temporary file instead of RAM, for mosaics and large planes."""
+    return np.memmap(tempfile.TemporaryFile(), dtype=dtype, mode='w+', shape=shape)
+
+
+def chunk_slices(chunks):
+    """Index tuples of every block of a dask array, given its .chunks."""
+    bounds = [np.concatenate([[0], np.cumsum(sizes)]) for sizes in chunks]
+    grids = np.meshgrid(*[np.arange(len(sizes)) for sizes in chunks], indexing='ij')
+    for idx in zip(*[g.ravel() for g in grids]):
+        yield tuple(slice(int(b[i]), int(b[i + 1])) for b, i in zip(bounds, idx))
+
+
+def _has_lut(dtype):
+    dtype = np.dtype(dtype)
+    return dtype.kind in 'ui' and dtype.itemsize <= 2
+
+
+class Histogram:
+    """Pixel values of a plane accumulated chunk by chunk, for contrast limits.
+
+    8- and 16-bit images are counted exactly (at most 65536 bins); other
+    dtypes keep an evenly strided subsample of at most MAX_SAMPLES values.
+    """
+
+    def __init__(self, dtype):
+        self.dtype = np.dtype(dtype)
+        if _has_lut(self.dtype):
+            self.offset = -int(np.iinfo(self.dtype).min)
+            self.counts = np.zeros(1 << (8 * self.dtype.itemsize), dtype=np.int64)
+        else:
+            self.counts = None
+            self.samples = []
+            self.n_samples = 0
+            self.stride = 1
+
+    def add(self, block):
+        if self.counts is not None:
+            values = block.ravel()
+            if self.offset:
+                values = values.astype(np.int32) + self.offset
+            self.counts += np.bincount(values, minlength=len(self.counts))
+            return
+        sample = block.ravel()[::self.stride]
+        self.samples.append(sample[np.isfinite(sample)] if sample.dtype.kind == 'f' else sample)
+        self.n_samples += len(sample)
+        if self.n_samples > MAX_SAMPLES:
+            # thin what is kept and sample the rest of the plane more sparsely
+            self.samples = [s[::2] for s in self.samples]
+            self.n_samples = sum(len(s) for s in self.samples)
+            self.stride *= 2
+
+    def limits(self, low=1, high=99):
+        """Pixel values at the low and high percentiles."""
+        if self.counts is None:
+            values = np.concatenate(self.samples) if self.samples else np.zeros(1)
+            return tuple(float(v) for v in np.percentile(values, (low, high)))
+        cum = np.cumsum(self.counts)
+        total = cum[-1]
+        if not total:
+            return 0.0, 1.0
+        idx = np.searchsorted(cum, [total * low / 100.0, total * high / 100.0], side='left')
+        return float(idx[0] - self.offset), float(idx[1] - self.offset)
+
+
+def display_values(image, low, high, out=None):
+    """image as kept for display and its display levels (low, high in its values).
+
+    8- and 16-bit data is kept as it is, the viewer's lookup table maps
+    low..high to the screen. Other dtypes are scaled to uint16 between low
+    and high once, in row blocks, at half the size of float32.
+    """
+    if _has_lut(image.dtype):
+        return image, (low, high)
+    if out is None:
+        out = np.empty(image.shape, dtype=np.uint16)
+    scale = 65535.0 / (high - low) if high > low else 1.0
+    for start in range(0, image.shape[0], _ROWS):
+        rows = image[start:start + _ROWS].astype(np.float32)
+        rows -= low
+        rows *= scale
+        np.clip(rows, 0, 65535, out=rows)
+        out[start:start + _ROWS] = np.rint(rows)
+    return out, (0.0, 65535.0)
+
+
+def downsample(image):
+    """image reduced 2x2 by averaging, in row blocks; odd edges average what is there."""
+    h, w = image.shape
+    out = np.empty(((h + 1) // 2, (w + 1) // 2), dtype=image.dtype)
+    rows = 2 * _ROWS
+    for start in range(0, h, rows):
+        block = np.asarray(image[start:start + rows], dtype=np.float32)
+        if block.shape[0] % 2:
+            block = np.concatenate([block, block[-1:]])
+        if w % 2:
+            block = np.concatenate([block, block[:, -1:]], axis=1)
+        mean = 0.25 * (block[0::2, 0::2] + block[1::2, 0::2] + block[0::2, 1::2] + block[1::2, 1::2])
+        if out.dtype.kind in 'ui':
+            mean = np.rint(mean)
+        out[start // 2:start // 2 + mean.shape[0]] = mean
+    return out
+
+
+def build_pyramid(image, min_size=PYRAMID_MIN_SIZE, cancel=None):
+    """[image, image/2, image/4, ...] down to a longest side of at most min_size.
+
+    None when cancel() turns true between levels.
+    """
+    levels = [image]
+    while max(levels[-1].shape) > min_size:
+        if cancel and cancel():
+            return None
+        levels.append(downsample(levels[-1]))
+    return levels
+
+
+def plane_info(overview, c=0, z=0, t=0):
+    """What the ROI selector needs to know about a plane and its scene, JSON-ready."""
+    plane = overview.plane_metadata(c, z, t)
+    return {
+        'pixel_size': overview.pixel_size,
+        'position_x': plane.position_x,
+        'position_y': plane.position_y,
+        'position_z': plane.position_z,
+        'scenes': [str(s) for s in overview.scenes],
+        'channel_names': overview.channel_names,
+        'n_z': overview.n_z,
+    }
+
+
+def load_preview(path, scene=0, c=0, z=0, cache=None, overview=None, progress=None, cancel=None, coarse=None):
+    """Preview levels and metadata of one plane; returns (levels, meta, overview).
+
+    With a PreviewCache a cached plane is memory mapped without touching
+    the ND2; otherwise the plane is read (opening the file unless an open
+    OverviewFile is passed), turned into display_values and stored in the
+    cache. meta['display_levels'] are the levels to show it with. levels is
+    None when loading was cancelled. While reading, coarse(image, step,
+    display_levels) is called every COARSE_INTERVAL s with the plane read so
+    far subsampled by step, for a preview that fills in as chunks arrive.
+
+    scene MOSAIC assembles all positions of a multi-point scan (see
+    mosaic_layout); meta then has the stage position of the mosaic centre
+    and the number of positions. A file with one scene just shows it.
+    """
+    if cache is not None:
+        cached = cache.get(path, (scene, c, z))
+        if cached is not None:
+            return cached[0], cached[1], overview
+    if overview is None:
+        overview = OverviewFile(path)
+    mosaic = scene == MOSAIC and len(overview.scenes) > 1
+    if mosaic:
+        layout = mosaic_layout(overview.positions(c, z))
+        dtype = overview.lazy_plane(c, z).dtype
+        raw = _scratch(layout['shape'], dtype)
+        on_disk = True
+    else:
+        if overview.scene_index != max(scene, 0):
+            overview.set_scene(max(scene, 0))
+        lazy = overview.lazy_plane(c, z)
+        on_disk = np.prod(lazy.shape, dtype=np.int64) * np.dtype(lazy.dtype).itemsize > SCRATCH_BYTES
+        # zeros: parts not read yet show as black in the coarse previews
+        raw = (_scratch if on_disk else np.zeros)(lazy.shape, dtype=lazy.dtype)
+    histogram = Histogram(raw.dtype)
+    step = max(1, -(-max(raw.shape) // COARSE_SIZE))
+    shown = [time.monotonic()]
+
+    def chunk_read(done, total):
+        if progress:
+            progress(done, total)
+        if coarse and done < total and time.monotonic() - shown[0] > COARSE_INTERVAL:
+            image, display_levels = display_values(raw[::step, ::step], *histogram.limits(1, 99))
+            coarse(image, step, display_levels)
+            shown[0] = time.monotonic()
+
+    if mosaic:
+        raw = overview.read_mosaic(layout, c, z, progress=chunk_read, cancel=cancel, histogram=histogram, out=raw)
+    else:
+        raw = overview.read_plane(c, z, progress=chunk_read, cancel=cancel, histogram=histogram, out=raw)
+    if raw is None:
+        return None, None, overview
+    low, high = histogram.limits(1, 99)
+    image, display_levels = display_values(raw, low, high, out=_scratch(raw.shape, np.uint16) if on_disk else None)
+    levels = build_pyramid(image, cancel=cancel)
+    # a cancelled plane is not cached either
+    if levels is None or (cancel and cancel()):
+        return None, None, overview
+    meta = dict(plane_info(overview, c, z), limits=[low, high], display_levels=list(display_levels))
+    if mosaic:
+        meta.update(pixel_size=layout['pixel_size'], positions=len(layout['rows']),
+                    **{key: layout[key] for key in ('position_x', 'position_y', 'position_z')})
+    if cache is not None:
+        levels = cache.put(path, (scene, c, z), levels, meta)
+    return levels, meta, overview
+
@@ -1,13 +1,149 @@
 import sys
 import os
+import threading
+from types import SimpleNamespace
 import numpy as np
 from PyQt5 import QtWidgets, QtCore, QtGui
 from PyQt5.QtWidgets import QFileDialog, QInputDialog, QMessageBox, QMainWindow, QPushButton, QHBoxLayout, QVBoxLayout, QWidget, QLabel, QComboBox, QCheckBox
-import pyqtgraph as pg
-from pyqtgraph import ImageView, ROI, RectROI, EllipseROI, PolyLineROI
-from PyQt5.QtWidgets import QGraphicsRectItem
-from bioio import BioImage
-import bioio_nd2
+from PyQt5.QtWidgets import QGraphicsRectItem, QSpinBox
+from pointlist_io import write_pointlist
+from travel_order import order_columns
+from acquisition_check import check_points, format_summary, report_path, write_report
+from partition import partition_points, write_stations, format_manifest, manifest_path
+from focus_surface import load_focus_surface, apply_focus
+from preview_cache import PreviewCache
+from tile_engine import roi_tiles, row_label
+from nd2_preview import MOSAIC
+
+# pyqtgraph and bioio are slow to import; the window is shown first, the viewer
+# is built right after and the ND2 reader is imported in the background.
+
+
+def _preload_reader():
+    try:
+        import bioio  # noqa: F401
+        import bioio_nd2  # noqa: F401
+    except ImportError:
+        # reported properly when a file is opened
+        pass
+
+
+class PlaneLoader(QtCore.QThread):
+    """Reads one overview plane (see nd2_preview.load_preview) off the UI thread."""
+
+    progress = QtCore.pyqtSignal(int, int)
+    coarse = QtCore.pyqtSignal(object, int, object)
+    loaded = QtCore.pyqtSignal(object, object)
+    failed = QtCore.pyqtSignal(str)
+
+    def __init__(self, path, scene, c, z, cache, overview=None, previous=None):
+        super().__init__()
+        self.path = path
+        self.plane = (scene, c, z)
+        self.cache = cache
+        self.overview = overview
+        # a cancelled loader that may still be reading the same file
+        self.previous = previous
+        self.new_file = False
+        self.reset_controls = False
+        self.cancelled = False
+
+    def run(self):
+        from nd2_preview import load_preview
+        if self.previous is not None:
+            # waited for here rather than on the UI thread; it stops after the chunk or level at hand
+            self.previous.wait()
+            self.previous = None
+        if self.isInterruptionRequested():
+            self.cancelled = True
+            return
+        try:
+            levels, meta, self.overview = load_preview(
+                self.path, *self.plane, cache=self.cache, overview=self.overview,
+                progress=self.progress.emit, cancel=self.isInterruptionRequested, coarse=self.coarse.emit)
+        except Exception as e:
+            self.failed.emit(str(e))
+            return
+        if levels is None:
+            self.cancelled = True
+        else:
+            self.loaded.emit(levels, meta)
+
+
+def roi_geometry(roi):
+    """(kind, transform, size, vertices) of a pyqtgraph ROI for tile_engine.roi_tiles.
+
+    transform is the 2x3 affine matrix from image pixels to ROI coordinates.
+    """
+    from pyqtgraph import EllipseROI, PolyLineROI
+    # ROI to image from where the ROI's origin and unit vectors land (position, angle and scale)
+    o, ex, ey = (roi.mapToParent(QtCore.QPointF(*p)) for p in ((0, 0), (1, 0), (0, 1)))
+    forward = np.array([[ex.x() - o.x(), ey.x() - o.x(), o.x()], [ex.y() - o.y(), ey.y() - o.y(), o.y()], [0, 0, 1]])
+    transform = np.linalg.inv(forward)[:2]
+    if isinstance(roi, PolyLineROI):
+        vertices = [(h['item'].pos().x(), h['item'].pos().y()) for h in roi.handles]
+        return 'polygon', transform, None, vertices
+    size = tuple(roi.size())
+    return ('ellipse' if isinstance(roi, EllipseROI) else 'rect'), transform, size, None
+
+
+class PyramidDisplay:
+    """Shows a plane's pyramid levels in an ImageItem, only the visible tiles of the level that suits the zoom.
+
+    The item is placed in full-resolution pixel coordinates (displayed as
+    np.flipud(plane.T)), so ROIs and FOVs drawn over it do not depend on
+    the level shown. The visible part is recomputed shortly after the view
+    is panned or zoomed.
+    """
+
+    TILE = 256
+
+    def __init__(self, view, item):
+        self.view = view
+        self.item = item
+        self.levels = None
+        self.factors = None
+        self.size = None
+        self.shown = None
+        self.timer = QtCore.QTimer()
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(30)
+        self.timer.timeout.connect(self.update)
+        view.sigRangeChanged.connect(lambda *args: self.timer.start())
+
+    def set_levels(self, levels, factors=None, size=None):
+        """Show new levels; factors[k] is how many full-resolution pixels a pixel of level k covers (default 2**k)."""
+        height, width = levels[0].shape
+        self.factors = factors or [2 ** k for k in range(len(levels))]
+        self.size = size or (width * self.factors[0], height * self.factors[0])
+        self.levels = levels
+        self.shown = None
+        self.update()
+
+    def update(self):
+        if self.levels is None:
+            return
+        (x0, x1), (y0, y1) = self.view.viewRange()
+        pixel = self.view.viewPixelSize()[0]
+        # the coarsest level that still has a pixel per screen pixel
+        k = max([k for k, f in enumerate(self.factors) if f <= pixel] or [0])
+        level, f = self.levels[k], self.factors[k]
+        height, width = level.shape
+        # displayed column u of the level is plane column width-1-u
+        offset = self.size[0] - f * width
+        t = self.TILE
+        i0, i1 = np.clip([np.floor((x0 - offset) / f / t) * t, np.ceil((x1 - offset) / f / t) * t], 0, width).astype(int).tolist()
+        j0, j1 = np.clip([np.floor(y0 / f / t) * t, np.ceil(y1 / f / t) * t], 0, height).astype(int).tolist()
+        if i1 <= i0 or j1 <= j0:
+            # panned off the image
+            self.item.clear()
+            self.shown = None
+            return
+        if (k, i0, i1, j0, j1) == self.shown:
+            return
+        self.shown = (k, i0, i1, j0, j1)
+        self.item.setImage(np.ascontiguousarray(np.flipud(level.T)[i0:i1, j0:j1]), autoLevels=False)
+        self.item.setRect(QtCore.QRectF(offset + i0 * f, j0 * f, (i1 - i0) * f, (j1 - j0) * f))
 
 
 class ROISelector(QMainWindow):
@@ -15,20 +151,40 @@ class ROISelector(QMainWindow):
         super().__init__()
         self.setWindowTitle("ND2 ROI Selector (PyQt5)")
 
-        self.image_view = ImageView()
-        self.image_view.ui.roiBtn.hide()
-        self.image_view.ui.menuBtn.hide()
+        self.image_view = None
+        self.viewer_placeholder = QLabel("Loading image viewer...")
+        self.viewer_placeholder.setAlignment(QtCore.Qt.AlignCenter)
 
         self.image_data = None
+        self.levels = None
+        self.pyramid = None
+        self.nd2_path = None
+        self.overview = None
+        self.preview_cache = PreviewCache()
+        self.loader = None
+        self.plane_meta = None
         self.nd2_metadata = None
         self.physical_pixel_size = None
         self.target_pixel_size = 0.160
         self.overlap = 0.05
+        self.fov_pixels = 2040
+        # 0 keeps tiles whose centre is in the ROI
+        self.min_fov_fraction = 0.0
         self.basename = "Image"
 
         self.roi_items = []
         self.roi_data = []
         self.fov_items_by_roi = {}
+        # roi -> (key, tiles): tiles are reused until the ROI or the imaging parameters change
+        self.tile_cache = {}
+        # roi -> key of the tiles its FOV outlines were drawn for
+        self.fov_keys = {}
+        # ROIs being edited are redrawn once they have been still for a moment
+        self.changed_rois = set()
+        self.roi_timer = QtCore.QTimer()
+        self.roi_timer.setSingleShot(True)
+        self.roi_timer.setInterval(200)
+        self.roi_timer.timeout.connect(self.update_changed_rois)
         self.current_roi_type = 'Rectangle'
         self.show_fovs = False
         self.selected_roi = None
@@ -37,6 +193,22 @@ class ROISelector(QMainWindow):
         self.shape_selector.addItems(['Rectangle', 'Ellipse', 'Circle', 'Freehand'])
         self.shape_selector.currentTextChanged.connect(self.change_shape)
 
+        # plane of the overview shown; filled when a file is opened
+        self.scene_selector = QComboBox()
+        self.scene_selector.currentIndexChanged.connect(self.change_scene)
+        self.channel_selector = QComboBox()
+        self.channel_selector.currentIndexChanged.connect(self.show_plane)
+        self.z_spinbox = QSpinBox()
+        self.z_spinbox.setRange(0, 0)
+        self.z_spinbox.valueChanged.connect(self.show_plane)
+
+        self.order_selector = QComboBox()
+        self.order_selector.addItems(['Snake', 'Shortest travel'])
+
+        self.stations_spinbox = QSpinBox()
+        self.stations_spinbox.setRange(1, 16)
+        self.stations_spinbox.setToolTip("More than one saves a point list per microscope, whole ROIs each")
+
         self.fov_checkbox = QCheckBox("Show Fields of View")
         self.fov_checkbox.stateChanged.connect(self.toggle_fovs)
 
@@ -49,6 +221,17 @@ class ROISelector(QMainWindow):
         save_btn = QPushButton("Save Point List")
         save_btn.clicked.connect(self.save_pointlist)
 
+        focus_btn = QPushButton("Load Focus Points")
+        focus_btn.clicked.connect(self.load_focus_points)
+        self.focus_surface = None
+
+        self.progress_bar = QtWidgets.QProgressBar()
+        self.progress_bar.setFormat("Reading %v/%m chunks")
+        self.progress_bar.hide()
+        self.cancel_btn = QPushButton("Cancel")
+        self.cancel_btn.clicked.connect(self.cancel_loading)
+        self.cancel_btn.hide()
+
         add_roi_btn = QPushButton("Add ROI")
         add_roi_btn.clicked.connect(self.add_roi)
 
@@ -56,62 +239,224 @@ class ROISelector(QMainWindow):
         controls.addWidget(load_btn)
         controls.addWidget(param_btn)
         controls.addWidget(save_btn)
+        controls.addWidget(focus_btn)
+        controls.addWidget(QLabel("Scene:"))
+        controls.addWidget(self.scene_selector)
+        controls.addWidget(QLabel("Channel:"))
+        controls.addWidget(self.channel_selector)
+        controls.addWidget(QLabel("Z:"))
+        controls.addWidget(self.z_spinbox)
         controls.addWidget(QLabel("ROI Shape:"))
         controls.addWidget(self.shape_selector)
         controls.addWidget(add_roi_btn)
         controls.addWidget(self.fov_checkbox)
+        controls.addWidget(self.progress_bar)
+        controls.addWidget(self.cancel_btn)
+        controls.addWidget(QLabel("Tile Order:"))
+        controls.addWidget(self.order_selector)
+        controls.addWidget(QLabel("Microscopes:"))
+        controls.addWidget(self.stations_spinbox)
 
-        layout = QVBoxLayout()
-        layout.addWidget(self.image_view)
-        layout.addLayout(controls)
+        self.main_layout = QVBoxLayout()
+        self.main_layout.addWidget(self.viewer_placeholder, 1)
+        self.main_layout.addLayout(controls)
 
         container = QWidget()
-        container.setLayout(layout)
+        container.setLayout(self.main_layout)
         self.setCentralWidget(container)
 
-        self.image_view.scene.sigMouseClicked.connect(self.select_roi)
         self.installEventFilter(self)
+        QtCore.QTimer.singleShot(0, self.init_viewer)
+
+    def init_viewer(self):
+        if self.image_view is not None:
+            return
+        from pyqtgraph import ImageView
+        self.image_view = ImageView()
+        self.image_view.ui.roiBtn.hide()
+        self.image_view.ui.menuBtn.hide()
+        # outline of the full image, so "View All" shows all of it
+        self.frame_item = QGraphicsRectItem()
+        self.frame_item.setPen(QtGui.QPen(QtCore.Qt.NoPen))
+        self.image_view.addItem(self.frame_item)
+        self.pyramid = PyramidDisplay(self.image_view.view, self.image_view.imageItem)
+        self.main_layout.replaceWidget(self.viewer_placeholder, self.image_view)
+        self.viewer_placeholder.deleteLater()
+        self.image_view.scene.sigMouseClicked.connect(self.select_roi)
+        threading.Thread(target=_preload_reader, daemon=True).start()
 
     def load_nd2(self):
         path, _ = QFileDialog.getOpenFileName(self, "Open ND2 file", "", "ND2 files (*.nd2)")
         if not path:
             return
 
-        self.basename = os.path.splitext(os.path.basename(path))[0]
-        bioimg = BioImage(path, reader=bioio_nd2.Reader)
-        self.nd2_metadata = bioimg.metadata.images[0].pixels.planes[0]
-        self.physical_pixel_size = bioimg.metadata.images[0].pixels.physical_size_x
-        img = bioimg.get_image_data().squeeze()
-        if img.ndim == 3:
-            img = img[0]
-        p1, p99 = np.percentile(img, (1, 99))
-        img = np.clip((img - p1) / (p99 - p1), 0, 1)
+        self.init_viewer()
+        # opened only if a plane is not in the preview cache, and then only that plane is read;
+        # a multi-point scan opens with all positions assembled
+        self.start_loading(path, MOSAIC, 0, 0, new_file=True)
+
+    def start_loading(self, path, scene, c, z, new_file=False, reset_controls=False):
+        """Read a plane in a worker thread; the window stays responsive and shows a coarse preview first."""
+        self.cancel_loading()
+        overview = None if new_file else self.overview
+        previous = self.loader if self.loader is not None and self.loader.isRunning() else None
+        self.loader = PlaneLoader(path, scene, c, z, self.preview_cache, overview, previous=previous)
+        self.loader.new_file = new_file
+        self.loader.reset_controls = reset_controls
+        self.loader.progress.connect(self.loading_progress)
+        self.loader.coarse.connect(self.show_coarse)
+        self.loader.loaded.connect(self.plane_loaded)
+        self.loader.failed.connect(self.loading_failed)
+        self.loader.finished.connect(self.loading_finished)
+        self.progress_bar.setRange(0, 0)
+        self.progress_bar.show()
+        self.cancel_btn.show()
+        self.loader.start()
+
+    def cancel_loading(self):
+        # not waited for, a cancelled loader reports finished once it stops and the next one waits for it
+        if self.loader is not None and self.loader.isRunning():
+            self.loader.requestInterruption()
+
+    def loading_progress(self, done, total):
+        self.progress_bar.setRange(0, total)
+        self.progress_bar.setValue(done)
+
+    def show_coarse(self, img, step, display_levels):
+        if self.sender() is not self.loader:
+            return
+        # subsampled plane read so far, scaled up so it covers the full-resolution pixel space
+        size = (img.shape[1] * step, img.shape[0] * step)
+        if size != self.pyramid.size:
+            self.fit_view(*size)
+        self.image_view.setLevels(*display_levels)
+        self.pyramid.set_levels([img], factors=[step], size=size)
+
+    def plane_loaded(self, levels, meta):
+        loader = self.sender()
+        if loader is not self.loader:
+            return
+        self.overview = loader.overview
+        if loader.new_file:
+            self.nd2_path = loader.path
+            self.basename = os.path.splitext(os.path.basename(loader.path))[0]
+            self.scene_selector.blockSignals(True)
+            self.scene_selector.clear()
+            if len(meta["scenes"]) > 1:
+                self.scene_selector.addItem("All positions (mosaic)", MOSAIC)
+            for index, name in enumerate(meta["scenes"]):
+                self.scene_selector.addItem(name, index)
+            self.scene_selector.setCurrentIndex(max(0, self.scene_selector.findData(loader.plane[0])))
+            self.scene_selector.blockSignals(False)
+        if loader.new_file or loader.reset_controls:
+            self.update_plane_controls(meta)
+        self.display_plane(levels, meta)
+
+    def loading_failed(self, message):
+        if self.sender() is not self.loader:
+            return
+        QMessageBox.warning(self, "Error", f"Could not read the image: {message}")
+
+    def loading_finished(self):
+        if self.sender() is self.loader:
+            self.progress_bar.hide()
+            self.cancel_btn.hide()
+            # a cancelled first plane leaves the previous image in place
+            if self.image_data is not None and self.loader.cancelled:
+                self.display_plane(self.levels, self.plane_meta)
+
+    def change_scene(self, index):
+        if self.nd2_path is None or index < 0:
+            return
+        self.start_loading(self.nd2_path, self.scene_selector.itemData(index), 0, 0, reset_controls=True)
+
+    def update_plane_controls(self, meta):
+        self.channel_selector.blockSignals(True)
+        self.channel_selector.clear()
+        self.channel_selector.addItems(meta["channel_names"])
+        self.channel_selector.blockSignals(False)
+        self.z_spinbox.blockSignals(True)
+        self.z_spinbox.setRange(0, meta["n_z"] - 1)
+        self.z_spinbox.setValue(0)
+        self.z_spinbox.blockSignals(False)
+
+    def show_plane(self, *args):
+        # ROIs stay where they are, every plane of a scene has the same size
+        if self.nd2_path is None:
+            return
+        scene = self.scene_selector.currentData()
+        scene = MOSAIC if scene is None else scene
+        c = max(0, self.channel_selector.currentIndex())
+        self.start_loading(self.nd2_path, scene, c, self.z_spinbox.value())
+
+    def display_plane(self, levels, meta):
+        # stage position of the plane, read by compute_tiles like the OME plane it replaces
+        self.nd2_metadata = SimpleNamespace(position_x=meta["position_x"], position_y=meta["position_y"],
+                                            position_z=meta["position_z"])
+        self.physical_pixel_size = meta["pixel_size"]
+        self.plane_meta = meta
+        self.levels = levels
+        self.image_data = levels[0]
+
+        # only the visible tiles of one level are drawn, however large the plane
+        size = (self.image_data.shape[1], self.image_data.shape[0])
+        if size != self.pyramid.size:
+            self.fit_view(*size)
+        # the preview keeps the file's values, contrast is the viewer's lookup table
+        self.image_view.setLevels(*meta["display_levels"])
+        self.pyramid.set_levels(levels)
+        if self.show_fovs:
+            # another scene can have another pixel size; unchanged tiles are not recomputed
+            for roi in self.roi_items:
+                self.draw_fovs(roi)
 
-        self.image_data = img
-        self.image_view.setImage(np.flipud(img.T), autoLevels=False)
+    def fit_view(self, width, height):
+        self.frame_item.setRect(0, 0, width, height)
+        self.image_view.view.setRange(QtCore.QRectF(0, 0, width, height), padding=0)
 
     def set_parameters(self):
         px, ok1 = QInputDialog.getDouble(self, "Target Pixel Size", "Enter target pixel size (e.g. 0.108):", self.target_pixel_size, 0.001, 10.0, 5)
         ov, ok2 = QInputDialog.getDouble(self, "Overlap (%)", "Enter overlap % (e.g. 10):", self.overlap * 100, 0, 99.9, 1)
+        fr, ok3 = QInputDialog.getDouble(self, "FOV inside ROI (%)", "Keep tiles with at least this % of the FOV in the ROI\n(0: tiles whose centre is in the ROI):", self.min_fov_fraction * 100, 0, 100, 0)
         if ok1:
             self.target_pixel_size = px
         if ok2:
             self.overlap = ov / 100.0
+        if ok3:
+            self.min_fov_fraction = fr / 100.0
+        if self.show_fovs:
+            for roi in self.roi_items:
+                self.draw_fovs(roi)
+
+    def load_focus_points(self):
+        # without focus points every tile gets the Z of the overview image
+        path, _ = QFileDialog.getOpenFileName(self, "Load Focus Points", "", "XML Files (*.xml)")
+        if not path:
+            self.focus_surface = None
+            return
+        try:
+            self.focus_surface = load_focus_surface(path)
+        except (ValueError, OSError, SyntaxError, np.linalg.LinAlgError) as e:
+            QMessageBox.warning(self, "Focus points", f"Cannot use {path}: {e}")
+            return
+        QMessageBox.information(self, "Focus points", f"Z of the tiles follows a {self.focus_surface.describe()}")
 
     def change_shape(self, shape):
         self.current_roi_type = shape
 
     def toggle_fovs(self, state):
         self.show_fovs = state == QtCore.Qt.Checked
-        self.clear_fovs()
-        self.roi_data = []
-        if self.show_fovs:
-            for roi in self.roi_items:
-                self.compute_tiles(roi, update_fovs=True)
+        for roi in self.roi_items:
+            if self.show_fovs:
+                self.draw_fovs(roi)
+            else:
+                for item in self.fov_items_by_roi.get(roi, []):
+                    item.setVisible(False)
 
     def add_roi(self):
         if self.image_data is None:
             return
+        from pyqtgraph import RectROI, EllipseROI, PolyLineROI
 
         shape = self.current_roi_type
         size = 100
@@ -129,8 +474,11 @@ class ROISelector(QMainWindow):
         roi.setAcceptedMouseButtons(QtCore.Qt.LeftButton)
         roi.setZValue(10)
 
+        roi.sigRegionChanged.connect(self.roi_changed)
         self.image_view.addItem(roi)
         self.roi_items.append(roi)
+        if self.show_fovs:
+            self.draw_fovs(roi)
 
     def select_roi(self, event):
         pos = event.scenePos()
@@ -151,94 +499,95 @@ class ROISelector(QMainWindow):
         if roi in self.roi_items:
             self.image_view.removeItem(roi)
             self.roi_items.remove(roi)
-            self.clear_fovs()
-            self.roi_data = []
-            if self.show_fovs:
-                for r in self.roi_items:
-                    self.compute_tiles(r, update_fovs=True)
-
-    def clear_fovs(self):
-        for items in self.fov_items_by_roi.values():
-            for item in items:
-                self.image_view.removeItem(item)
-        self.fov_items_by_roi = {}
+            # the other ROIs keep their tiles, only their numbers in the names change
+            self.remove_fovs(roi)
+            self.tile_cache.pop(roi, None)
+            self.changed_rois.discard(roi)
+
+    def roi_changed(self, roi):
+        # emitted continuously while a ROI is dragged
+        self.tile_cache.pop(roi, None)
+        self.changed_rois.add(roi)
+        self.roi_timer.start()
+
+    def update_changed_rois(self):
+        if self.show_fovs:
+            for roi in self.changed_rois:
+                if roi in self.roi_items:
+                    self.draw_fovs(roi)
+        self.changed_rois = set()
+
+    def remove_fovs(self, roi):
+        for item in self.fov_items_by_roi.pop(roi, []):
+            self.image_view.removeItem(item)
+        self.fov_keys.pop(roi, None)
+
+    def tile_key(self, roi):
+        """What the tiles of a ROI depend on: its geometry and the imaging parameters."""
+        state = repr(sorted(roi.saveState().items()))
+        return (state, self.target_pixel_size, self.overlap, self.fov_pixels, self.min_fov_fraction,
+                self.physical_pixel_size)
+
+    def cached_tiles(self, roi):
+        """(x, y, row, col) arrays of a ROI's tiles in image pixels, computed only when the key changed."""
+        key = self.tile_key(roi)
+        cached = self.tile_cache.get(roi)
+        if cached is not None and cached[0] == key:
+            return key, cached[1]
+        fov_px = self.target_pixel_size * self.fov_pixels / self.physical_pixel_size
+        # the grid covers the bounding box in image pixels; pos() and size() do not describe freehand ROIs
+        box = roi.mapRectToParent(roi.boundingRect())
+        kind, transform, size, vertices = roi_geometry(roi)
+        tiles = roi_tiles((box.x(), box.y(), box.width(), box.height()), fov_px * (1 - self.overlap), fov_px,
+                          transform, kind, size=size, vertices=vertices, min_fraction=self.min_fov_fraction)
+        self.tile_cache[roi] = (key, tiles)
+        return key, tiles
+
+    def draw_fovs(self, roi):
+        """Show the FOV outlines of a ROI's tiles, redrawn only if its tiles changed."""
+        if self.image_data is None:
+            return
+        key, (dx, dy, _, _) = self.cached_tiles(roi)
+        if self.fov_keys.get(roi) != key:
+            from pyqtgraph import mkPen
+            self.remove_fovs(roi)
+            fov_px = self.target_pixel_size * self.fov_pixels / self.physical_pixel_size
+            pen = mkPen('lime', width=1)
+            items = []
+            for x, y in zip(dx.tolist(), dy.tolist()):
+                rect = QGraphicsRectItem(x - fov_px / 2, y - fov_px / 2, fov_px, fov_px)
+                rect.setPen(pen)
+                self.image_view.addItem(rect)
+                items.append(rect)
+            self.fov_items_by_roi[roi] = items
+            self.fov_keys[roi] = key
+        for item in self.fov_items_by_roi[roi]:
+            item.setVisible(self.show_fovs)
 
     def compute_tiles(self, roi, update_fovs=False):
+        """Add the points of a ROI's tiles to roi_data (and show their FOVs)."""
         if update_fovs:
-            for item in self.fov_items_by_roi.get(roi, []):
-                self.image_view.removeItem(item)
-            self.fov_items_by_roi[roi] = []
-
-            for item in self.fov_items_by_roi.get(roi, []):
-                self.image_view.removeItem(item)
-            self.fov_items_by_roi[roi] = []
-
+            self.draw_fovs(roi)
         roi_number = self.roi_items.index(roi) + 1
-        px_size_preview = self.physical_pixel_size
-        target_pixel_size = self.target_pixel_size
-        fov_pixels = 2040
-        fov_um = target_pixel_size * fov_pixels
-        step_um = fov_um * (1 - self.overlap)
-
         stage_x_center = self.nd2_metadata.position_x
         stage_y_center = self.nd2_metadata.position_y
         stage_z = self.nd2_metadata.position_z
-
-        x0_img, y0_img = roi.pos()
-        w_img, h_img = roi.size()
         img_center_x = self.image_data.shape[1] / 2
         img_center_y = self.image_data.shape[0] / 2
 
-        stage_x0 = stage_x_center + (x0_img - img_center_x) * px_size_preview
-        stage_y0 = stage_y_center + (y0_img - img_center_y) * px_size_preview
-        stage_x1 = stage_x_center + ((x0_img + w_img) - img_center_x) * px_size_preview
-        stage_y1 = stage_y_center + ((y0_img + h_img) - img_center_y) * px_size_preview
-
-        width_um = stage_x1 - stage_x0
-        height_um = stage_y1 - stage_y0
-
-        nx = max(1, int(np.floor(width_um / step_um)))
-        ny = max(1, int(np.floor(height_um / step_um)))
-
-        # Adjusted start to keep centers within ROI
-        x_start = stage_x0 + (width_um - (nx - 1) * step_um) / 2
-        y_start = stage_y0 + (height_um - (ny - 1) * step_um) / 2
-
-        roi_mask = roi.getArrayRegion(np.ones_like(self.image_data).T, self.image_view.imageItem).astype(bool).T
-
-        for iy in range(ny):
-            row_letter = chr(ord('A') + iy)
-            xs = [x_start + i * step_um for i in range(nx)]
-            if iy % 2 == 1:
-                xs = xs[::-1]
-            for ix, px in enumerate(xs):
-                py = y_start + iy * step_um
-                dx = (px - stage_x_center) / px_size_preview + img_center_x
-                dy = (py - stage_y_center) / px_size_preview + img_center_y
-
-                if (0 <= int(dy) < roi_mask.shape[0]) and (0 <= int(dx) < roi_mask.shape[1]):
-                    if not roi_mask[int(dy), int(dx)]:
-                        continue
-
-                col_number = ix + 1
-                name = f"{self.basename}_ROI{roi_number}_{row_letter}{col_number}"
-
-                self.roi_data.append({
-                    "name": name,
-                    "x": px,
-                    "y": py,
-                    "z": stage_z,
-                    "PSF": 0.0,
-                    "checked": "true"
-                })
-
-                if update_fovs:
-                    fov_px = fov_um / px_size_preview
-                    rect = QGraphicsRectItem(dx - fov_px / 2, dy - fov_px / 2, fov_px, fov_px)
-                    rect.setPen(pg.mkPen('lime', width=1))
-                    rect.setVisible(self.show_fovs)
-                    self.image_view.addItem(rect)
-                    self.fov_items_by_roi[roi].append(rect)
+        _, (dx, dy, rows, cols) = self.cached_tiles(roi)
+        xs = stage_x_center + (dx - img_center_x) * self.physical_pixel_size
+        ys = stage_y_center + (dy - img_center_y) * self.physical_pixel_size
+
+        self.roi_data.extend({
+            "name": f"{self.basename}_ROI{roi_number}_{row_label(row)}{col + 1}",
+            "x": px,
+            "y": py,
+            "z": stage_z,
+            "PSF": 0.0,
+            "checked": "true",
+            "roi": roi_number,
+        } for px, py, row, col in zip(xs.tolist(), ys.tolist(), rows.tolist(), cols.tolist()))
 
     def save_pointlist(self):
         if not self.roi_items:
@@ -257,32 +606,32 @@ class ROISelector(QMainWindow):
         if not path:
             return
 
-        xml_lines = [
-            '<variant version="1.0">',
-            '<no_name runtype="CLxListVariant">',
-            '<bIncludeZ runtype="bool" value="false"/>',
-            '<bPFSEnabled runtype="bool" value="true"/>'
-        ]
-
-        for idx, row in enumerate(self.roi_data):
-            point_xml = [
-                f'<Point{idx:05d} runtype="NDSetupMultipointListItem">',
-                f'<bChecked runtype="bool" value="{row["checked"]}"/>',
-                f'<strName runtype="CLxStringW" value="{row["name"]}"/>',
-                f'<dXPosition runtype="double" value="{row["x"]}"/>',
-                f'<dYPosition runtype="double" value="{row["y"]}"/>',
-                f'<dZPosition runtype="double" value="{row["z"]}"/>',
-                f'<dPFSOffset runtype="double" value="{row["PSF"]}"/>',
-                '<baUserData runtype="CLxByteArray" value=""/>',
-                f'</Point{idx:05d}>'
-            ]
-            xml_lines.extend(point_xml)
-
-        xml_lines.extend(['</no_name>', '</variant>'])
-        with open(path, 'w', encoding='utf-8') as f:
-            f.write('\n'.join(xml_lines))
-
-        QMessageBox.information(self, "Saved", f"Point list saved to {path}")
+        columns = {key: [row[key] for row in self.roi_data] for key in ("name", "x", "y", "z", "PSF", "checked", "roi")}
+        if self.focus_surface is not None:
+            columns = apply_focus(columns, self.focus_surface)
+        if self.order_selector.currentText() == 'Shortest travel':
+            # ROIs are still imaged one after the other
+            columns, _ = order_columns(columns, groups=columns["roi"])
+
+        # tiles of one ROI are a full step apart, closer ones come from overlapping ROIs
+        step_um = self.target_pixel_size * self.fov_pixels * (1 - self.overlap)
+        report = check_points(columns, min_distance=0.5 * step_um)
+        summary = format_summary(report)
+        if report["errors"]:
+            answer = QMessageBox.question(self, "Point list has errors", summary + "\n\nSave anyway?")
+            if answer != QMessageBox.Yes:
+                return
+        write_report(report, report_path(path))
+        if self.stations_spinbox.value() > 1:
+            manifest = write_stations(partition_points(columns, self.stations_spinbox.value(), groups=columns["roi"]), path,
+                                      include_z=self.focus_surface is not None)
+            summary += "\n" + format_manifest(manifest)
+            saved = f"{len(manifest['stations'])} station point lists saved, manifest: {manifest_path(path)}"
+        else:
+            write_pointlist(path, columns, include_z=self.focus_surface is not None)
+            saved = f"Point list saved to {path}"
+
+        QMessageBox.information(self, "Saved", f"{saved}\n\n{summary}")
 
 
 if __name__ == "__main__":
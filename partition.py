@@ -0,0 +1,168 @@
+"""Split a pointlist across several microscopes, balanced by estimated run time.
+
+Groups of points (wells, ROIs, source files) are never split. All points
+are first put in the order with the shortest stage travel, group by group;
+that route is then cut into one contiguous stretch per station so that the
+longest estimated run is as short as possible. Each station gets a
+spatially compact part of the plate that is already in travel order:
+
+    python partition.py plate1.xml -n 3          # plate1_station1.xml ... + plate1.stations.json
+
+Points are grouped by their name without the last "_" part (A1_3 -> A1,
+exp_ROI2_B4 -> exp_ROI2), which matches the names the three tools write.
+"""
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+from acquisition_check import DEFAULT_MODEL, check_points, format_duration, move_times
+from pointlist_io import read_pointlist, write_pointlist
+from travel_order import order_columns
+
+
+def name_groups(names):
+    """Group label per point: the name without its last '_' part."""
+    return np.array([str(name).rsplit('_', 1)[0] for name in names], dtype=object)
+
+
+def point_times(x, y, model=None):
+    """Seconds each point adds to a run: the move there, settling and imaging."""
+    model = dict(DEFAULT_MODEL, **(model or {}))
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    times = np.full(len(x), model['exposure'] * model['channels'] + model['focus'])
+    if len(x) > 1:
+        dx, dy = np.diff(x), np.diff(y)
+        times[1:] += move_times(dx, dy, model) + np.where((dx != 0) | (dy != 0), model['settle'], 0.0)
+    return times
+
+
+def balanced_cuts(loads, n):
+    """Cut positions splitting loads into at most n contiguous runs with the smallest largest sum."""
+    loads = np.asarray(loads, dtype=float)
+    cum = np.concatenate([[0.0], np.cumsum(loads)])
+
+    def cuts_for(capacity):
+        cuts = [0]
+        while cuts[-1] < len(loads):
+            nxt = int(np.searchsorted(cum, cum[cuts[-1]] + capacity, side='right')) - 1
+            if nxt <= cuts[-1]:
+                return None
+            cuts.append(nxt)
+        return cuts
+
+    if not len(loads):
+        return [0]
+    lo, hi = loads.max(), cum[-1]
+    # bisect the largest run; 50 halvings are far below a second of run time
+    for _ in range(50):
+        mid = (lo + hi) / 2
+        cuts = cuts_for(mid)
+        if cuts is not None and len(cuts) - 1 <= n:
+            hi = mid
+        else:
+            lo = mid
+    return cuts_for(hi * (1 + 1e-12))
+
+
+def partition_points(columns, n_stations, groups=None, model=None):
+    """Columns of each station's pointlist, in travel order; returns a list of column dicts.
+
+    groups gives a label per point (default: name_groups of the names); a
+    group always goes to a single station. Fewer lists than n_stations are
+    returned when there are fewer groups.
+    """
+    if groups is None:
+        groups = name_groups(columns['name'])
+    columns = dict(columns, _group=np.asarray(groups))
+    ordered, _ = order_columns(columns, groups=columns['_group'])
+    times = point_times(ordered['x'], ordered['y'], model)
+
+    labels = ordered.pop('_group')
+    # the route visits each group once, so group boundaries are where the label changes
+    starts = np.flatnonzero(np.concatenate([[True], labels[1:] != labels[:-1]]))
+    group_loads = np.add.reduceat(times, starts) if len(starts) else np.empty(0)
+    bounds = np.append(starts, len(labels))
+    cuts = balanced_cuts(group_loads, n_stations)
+    return [{key: col[bounds[a]:bounds[b]] for key, col in ordered.items()}
+            for a, b in zip(cuts[:-1], cuts[1:])]
+
+
+def station_path(output, station):
+    """plate1.xml -> plate1_station2.xml (also for .xml.gz)."""
+    base, ext = os.fspath(output), ''
+    for suffix in ('.gz', '.xml'):
+        if base.endswith(suffix):
+            base, ext = base[:-len(suffix)], suffix + ext
+    return f'{base}_station{station}{ext or ".xml"}'
+
+
+def write_stations(parts, output, model=None, precision=None, include_z=False):
+    """Write one pointlist per station and the manifest next to output; returns the manifest."""
+    stations = []
+    for k, part in enumerate(parts, 1):
+        path = station_path(output, k)
+        write_pointlist(path, part, precision=precision, include_z=include_z)
+        report = check_points(part, model=model)
+        stations.append({
+            'station': k,
+            'file': os.path.basename(path),
+            'points': len(part['x']),
+            'first': str(part['name'][0]) if len(part['x']) else None,
+            'last': str(part['name'][-1]) if len(part['x']) else None,
+            'estimated_s': report['time_s']['total'],
+            'travel_um': report['travel_um'],
+            'errors': report['errors'],
+        })
+    times = [s['estimated_s'] for s in stations]
+    manifest = {
+        'source': os.path.basename(os.fspath(output)),
+        'stations': stations,
+        'longest_s': max(times, default=0.0),
+        'imbalance': (max(times) / (sum(times) / len(times)) - 1) if times and sum(times) else 0.0,
+        'model': dict(DEFAULT_MODEL, **(model or {})),
+    }
+    with open(manifest_path(output), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def manifest_path(output):
+    base = os.fspath(output)
+    for suffix in ('.gz', '.xml'):
+        if base.endswith(suffix):
+            base = base[:-len(suffix)]
+    return base + '.stations.json'
+
+
+def format_manifest(manifest):
+    return '\n'.join(f"station {s['station']}: {s['points']} points, about {format_duration(s['estimated_s'])} "
+                     f"-> {s['file']}" for s in manifest['stations'])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('pointlist', help='NIS pointlist XML to split')
+    parser.add_argument('-n', '--stations', type=int, required=True, help='number of microscopes')
+    parser.add_argument('-o', '--output', default=None,
+                        help='base name of the station lists (default: the input name)')
+    parser.add_argument('--precision', type=int, default=None, help='decimals for coordinates')
+    parser.add_argument('--include-z', action='store_true',
+                        help='have NIS use the Z of each point, e.g. of a list from focus_surface.py')
+    for key, value in DEFAULT_MODEL.items():
+        parser.add_argument(f'--{key}', type=type(value), default=value, help=f'(default: {value})')
+    args = parser.parse_args(argv)
+
+    model = {key: getattr(args, key) for key in DEFAULT_MODEL}
+    parts = partition_points(read_pointlist(args.pointlist), args.stations, model=model)
+    manifest = write_stations(parts, args.output or args.pointlist, model=model, precision=args.precision,
+                              include_z=args.include_z)
+    print(format_manifest(manifest))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,289 @@
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+from site_patterns import poisson_disk_sites, site_pattern, broadcast_pattern, InfeasibleLayoutError
+from pointlist_io import write_pointlist
+from travel_order import order_points
+from tile_engine import row_label
+
+
+class PlateGeometry:
+    """Rows, columns, well pitch and well diameter (mm) of a plate format.
+
+    Wells are numbered 1..rows*cols row-major (A1=1, A2=2, ...), the same
+    numbering the selector has always used for the 96-well plate.
+    """
+
+    def __init__(self, rows, cols, pitch, well_diameter):
+        self.rows = rows
+        self.cols = cols
+        self.pitch = pitch
+        self.well_diameter = well_diameter
+
+    @property
+    def n_wells(self):
+        return self.rows * self.cols
+
+    def row_label(self, row):
+        # A..Z, then AA, AB, ... for 1536-well plates
+        return row_label(row)
+
+    def well_id(self, index):
+        row, col = divmod(index - 1, self.cols)
+        return f'{self.row_label(row)}{col + 1}'
+
+    def well_index(self, row, col):
+        return row * self.cols + col + 1
+
+
+PLATE_FORMATS = {
+    '96': PlateGeometry(8, 12, 9.0, 6.4),
+    '384': PlateGeometry(16, 24, 4.5, 3.3),
+    '1536': PlateGeometry(32, 48, 2.25, 1.5),
+}
+
+
+def snake_order(selection):
+    """1-based indices of the selected wells, row by row, alternating column direction.
+
+    selection is a (rows, cols) boolean array.
+    """
+    rows, cols = np.nonzero(selection)
+    key = np.where(rows % 2 == 0, cols, -cols)
+    order = np.lexsort((key, rows))
+    return rows[order] * selection.shape[1] + cols[order] + 1
+
+
+# Layout spec defaults, in the units of the selector's sliders
+DEFAULT_SPEC = {
+    'format': '96',
+    'wells': [],
+    'number_per_well': 10,
+    'well_diameter': 3.5, # mm
+    'distance': 0.340432, # mm
+    'well_to_well_distance': None, # mm, None uses the plate format pitch
+    'offset': {'x': 48510, 'y': -31800}, # um, stage position of A1
+    'PSF': 7050,
+    'z': 100, # um, written for every point
+    'pattern': 'Random',
+    'same_pattern': False,
+    'seed': None,
+    'fill_well': False,
+    'fov': 326, # um
+    'overlap': 5, # %
+    'order': 'snake', # 'snake': wells in row snake order, sites as generated; 'travel': shortest stage travel
+    'stations': 1, # > 1 splits the plate into one pointlist per microscope, whole wells each
+    'focus_points': None, # pointlist of measured focus positions; Z then follows their surface instead of 'z'
+    'focus_kind': 'auto', # 'plane', 'tps' or 'auto', see focus_surface.py
+}
+
+ORDERS = ('snake', 'travel')
+
+COVERAGE_PATTERNS = ('Hex', 'Rings', 'Spiral')
+
+
+def full_spec(spec):
+    """spec merged over DEFAULT_SPEC."""
+    merged = dict(DEFAULT_SPEC)
+    merged.update(spec)
+    merged['offset'] = dict(DEFAULT_SPEC['offset'], **spec.get('offset', {}))
+    if merged['well_to_well_distance'] is None:
+        merged['well_to_well_distance'] = PLATE_FORMATS[str(merged['format'])].pitch
+    return merged
+
+
+def parse_well_id(well_id, geometry):
+    """'B3' -> 1-based well index."""
+    well_id = well_id.strip().upper()
+    letters = well_id.rstrip('0123456789')
+    row = 0
+    for ch in letters:
+        row = row * 26 + ord(ch) - ord('A') + 1
+    row -= 1
+    col = int(well_id[len(letters):]) - 1
+    if not letters or not (0 <= row < geometry.rows and 0 <= col < geometry.cols):
+        raise ValueError(f'{well_id!r} is not a well of a {geometry.n_wells}-well plate')
+    return geometry.well_index(row, col)
+
+
+def selection_from_wells(wells, geometry):
+    """Boolean (rows, cols) selection from well IDs (or 'all')."""
+    selection = np.zeros((geometry.rows, geometry.cols), dtype=bool)
+    if wells == 'all':
+        selection[:] = True
+    else:
+        selection.flat[[parse_well_id(w, geometry) - 1 for w in wells]] = True
+    return selection
+
+
+def well_centers(indices, cols, offset, well_to_well_distance):
+    """Stage coordinates (um) of well centers for 1-based indices.
+
+    X coordinates reduce when moving along a row, Y coordinates increase
+    moving down the plate; offset is the stage position of A1.
+    """
+    indices = np.asarray(indices)
+    return np.column_stack([
+        ((offset['x'] / 1000.0) - (((indices - 1) % cols) * well_to_well_distance)) * 1000,
+        ((offset['y'] / 1000.0) + (((indices - 1) // cols) * well_to_well_distance)) * 1000,
+    ])
+
+
+def number_of_sites(spec):
+    # None means every site of a coverage layout
+    if spec['pattern'] in COVERAGE_PATTERNS and spec['fill_well']:
+        return None
+    return spec['number_per_well']
+
+
+def layout_pattern(spec):
+    """The one pattern shared by every well, (n, 2) um around the center."""
+    return site_pattern(spec['pattern'],
+                        spec['well_diameter'] * 1000,
+                        spec['distance'] * 2000,
+                        number_of_sites(spec),
+                        rng=spec['seed'],
+                        fov=spec['fov'],
+                        overlap=spec['overlap'] / 100.0)
+
+
+def local_sites(n_wells, spec, time_limit=None):
+    """Sites relative to the well center for n_wells wells, (n_wells, n, 2) um.
+
+    Random sites are drawn independently per well unless same_pattern is
+    set; every other pattern is computed once and broadcast. Raises
+    InfeasibleLayoutError if the sites cannot fit (or, for random sites,
+    cannot be found within time_limit seconds).
+    """
+    if spec['pattern'] == 'Random' and not spec['same_pattern']:
+        return poisson_disk_sites(np.zeros((n_wells, 2)),
+                                  spec['well_diameter'] * 1000,
+                                  spec['distance'] * 2000,
+                                  spec['number_per_well'],
+                                  rng=spec['seed'],
+                                  time_limit=time_limit)
+    return broadcast_pattern(np.zeros((n_wells, 2)), layout_pattern(spec))
+
+
+def layout_points(spec, local=None):
+    """Columns (name, x, y, z, PSF, checked) of the point list for a layout spec.
+
+    Wells are in snake order, or with order 'travel' in the order with the
+    shortest stage travel, each well finished before the next; sites are
+    numbered per well in the order they are visited. local can be passed in
+    to reuse sites that were already generated for the snake-ordered wells
+    (the selector's preview cache).
+    """
+    spec = full_spec(spec)
+    geometry = PLATE_FORMATS[str(spec['format'])]
+    indices = snake_order(selection_from_wells(spec['wells'], geometry))
+    if local is None:
+        local = local_sites(len(indices), spec)
+    coords = well_centers(indices, geometry.cols, spec['offset'], spec['well_to_well_distance'])[:, None, :] + local
+    n = coords.shape[1] if coords.ndim == 3 else 0
+    coords = coords.reshape(-1, 2)
+    wells = np.repeat(indices, n)
+    if spec['order'] == 'travel' and len(coords):
+        order = order_points(coords[:, 0], coords[:, 1], groups=wells)
+        coords, wells = coords[order], wells[order]
+    elif spec['order'] not in ORDERS:
+        raise ValueError(f"unknown order {spec['order']!r}, expected one of {ORDERS}")
+    if spec['focus_points']:
+        from focus_surface import load_focus_surface
+        z = load_focus_surface(spec['focus_points'], kind=spec['focus_kind'])(coords[:, 0], coords[:, 1])
+    else:
+        z = np.full(len(coords), spec['z'])
+    return {
+        'name': [f'{geometry.well_id(i)}_{k % n}' for k, i in enumerate(wells.tolist())],
+        'x': coords[:, 0],
+        'y': coords[:, 1],
+        'z': z,
+        'PSF': np.full(len(indices) * n, spec['PSF']),
+        'checked': np.ones(len(indices) * n, dtype=bool),
+    }
+
+
+def write_layout(spec, output, precision=None):
+    """Generate one plate and write its NIS pointlist(s); returns (output, number of points)."""
+    points = layout_points(spec)
+    spec = full_spec(spec)
+    # a constant Z is only a placeholder, Z from focus points is meant to be used
+    include_z = bool(spec['focus_points'])
+    if spec['stations'] > 1:
+        from partition import partition_points, write_stations
+        write_stations(partition_points(points, spec['stations']), output, precision=precision, include_z=include_z)
+        return output, len(points['x'])
+    return output, write_pointlist(output, points, precision=precision, include_z=include_z)
+
+
+def load_specs(path):
+    # a spec file holds one spec or a list of them
+    with open(path) as f:
+        specs = json.load(f)
+    return specs if isinstance(specs, list) else [specs]
+
+
+def _output_path(spec, spec_path, k, n, output_dir):
+    if 'output' in spec:
+        out = spec['output']
+        if not os.path.isabs(out):
+            out = os.path.join(output_dir or os.path.dirname(os.path.abspath(spec_path)), out)
+        return out
+    base = os.path.splitext(os.path.basename(spec_path))[0]
+    name = f'{base}.xml' if n == 1 else f'{base}_{k + 1:02d}.xml'
+    return os.path.join(output_dir or os.path.dirname(os.path.abspath(spec_path)), name)
+
+
+def _resolve_inputs(spec, spec_path):
+    # a relative focus_points is next to the spec, wherever the command is run from
+    focus = spec.get('focus_points')
+    if focus and not os.path.isabs(focus):
+        spec = dict(spec, focus_points=os.path.join(os.path.dirname(os.path.abspath(spec_path)), focus))
+    return spec
+
+
+def main(argv=None):
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    parser = argparse.ArgumentParser(
+        description='Generate NIS pointlists from plate layout specs (JSON) without the GUI.')
+    parser.add_argument('specs', nargs='+', help='JSON files, each with one layout spec or a list of them')
+    parser.add_argument('-o', '--output-dir', help='where to write the pointlists (default: next to each spec)')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='worker processes (default: one per CPU)')
+    parser.add_argument('--precision', type=int, default=None,
+                        help='decimals for coordinates (default: full precision); outputs ending in .gz are gzipped')
+    args = parser.parse_args(argv)
+
+    jobs = []
+    for spec_path in args.specs:
+        specs = load_specs(spec_path)
+        for k, spec in enumerate(specs):
+            jobs.append((_resolve_inputs(spec, spec_path), _output_path(spec, spec_path, k, len(specs), args.output_dir)))
+    # 'output' in a spec may name a subfolder too
+    for folder in {os.path.dirname(os.path.abspath(output)) for _, output in jobs}:
+        os.makedirs(folder, exist_ok=True)
+
+    failed = 0
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        futures = {pool.submit(write_layout, spec, output, args.precision): output for spec, output in jobs}
+        for future in as_completed(futures):
+            try:
+                output, n = future.result()
+                print(f'{output}: {n} points')
+            except (InfeasibleLayoutError, ValueError, KeyError, OSError) as e:
+                failed += 1
+                print(f'{futures[future]}: {e}', file=sys.stderr)
+            except Exception as e:
+                # anything else (a malformed spec value, a focus fit) fails this plate, not the batch
+                failed += 1
+                print(f'{futures[future]}: {type(e).__name__}: {e}', file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
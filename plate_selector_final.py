@@ -1,8 +1,180 @@
 import sys
-from PyQt5.QtWidgets import QApplication, QWidget, QPushButton, QVBoxLayout, QGridLayout, QLabel, QFileDialog, QHBoxLayout, QSlider
-from PyQt5.QtCore import Qt, QRect, QPoint
-from PyQt5.QtGui import QPainter, QPen
+from PyQt5.QtWidgets import QApplication, QWidget, QPushButton, QVBoxLayout, QGridLayout, QLabel, QFileDialog, QHBoxLayout, QSlider, QMessageBox, QCheckBox, QComboBox, QSpinBox
+from PyQt5.QtCore import Qt, QRect, QRectF, QPoint, QTimer, pyqtSignal
+from PyQt5.QtGui import QPainter, QPen, QBrush, QColor, QImage, QPolygonF
 import json
+import numpy as np
+from site_patterns import max_sites, InfeasibleLayoutError
+from plate_layout import PLATE_FORMATS, snake_order, local_sites, layout_pattern, layout_points
+from pointlist_io import write_pointlist
+from acquisition_check import check_points, format_summary, report_path, write_report
+from partition import partition_points, write_stations, format_manifest
+from focus_surface import load_focus_surface
+
+# seconds the preview may spend searching random sites before it reports the settings
+PREVIEW_TIME_LIMIT = 0.5
+
+
+class PlateView(QWidget):
+    """Custom-painted plate; wells are hit-tested arithmetically from the geometry.
+
+    Selection is a (rows, cols) boolean array. A click toggles one well, a
+    drag selects every well whose center is inside the rubber band (added to
+    the selection with Ctrl held, replacing it otherwise).
+    """
+    selectionChanged = pyqtSignal()
+
+    margin = 20 # room for row/column labels
+
+    def __init__(self, geometry, parent=None):
+        super().__init__(parent)
+        self.setMinimumSize(400, 280)
+        self.drag_start_pos = None
+        self.drag_end_pos = None
+        self.ctrl_pressed = False
+        self.sites = None
+        self.overlay = None
+        self.setGeometryModel(geometry)
+
+    def setGeometryModel(self, geometry):
+        self.plate = geometry
+        self.selection = np.zeros((geometry.rows, geometry.cols), dtype=bool)
+        self.sites = None
+        self.overlay = None
+        self.update()
+        self.selectionChanged.emit()
+
+    def setSites(self, indices, local, fov, pitch):
+        """Show generated sites: local is (len(indices), n, 2) um around each well center."""
+        self.sites = None if local is None or not local.size else (np.asarray(indices), local, fov, pitch)
+        self.overlay = None
+        self.update()
+
+    def resizeEvent(self, event):
+        self.overlay = None
+        super().resizeEvent(event)
+
+    def renderOverlay(self):
+        # sites and FOV footprints are rasterized once per change, paintEvent only blits the image
+        self.overlay = QImage(self.size(), QImage.Format_ARGB32_Premultiplied)
+        self.overlay.fill(Qt.transparent)
+        if self.sites is None:
+            return
+        indices, local, fov, pitch = self.sites
+        cell = self.cellSize()
+        scale = cell / pitch
+        rows, cols = np.divmod(indices - 1, self.plate.cols)
+        centers = np.column_stack((self.margin + (cols + 0.5) * cell, self.margin + (rows + 0.5) * cell))
+        # stage x decreases along a row, stage y increases down the plate
+        pts = (centers[:, None, :] + local * [-scale, scale]).reshape(-1, 2)
+
+        # fill a QPolygonF straight from the array, one draw call for all points
+        poly = QPolygonF(len(pts))
+        buf = poly.data()
+        buf.setsize(pts.size * 8)
+        np.frombuffer(buf, dtype=np.float64)[:] = pts.ravel()
+
+        painter = QPainter(self.overlay)
+        fov_px = fov * scale
+        if fov_px >= 2:
+            pen = QPen(QColor(0, 160, 0, 70))
+            pen.setWidthF(fov_px)
+            pen.setCapStyle(Qt.SquareCap)
+            painter.setPen(pen)
+            painter.drawPoints(poly)
+        painter.setPen(QPen(Qt.black, 0))
+        painter.drawPoints(poly)
+        painter.end()
+
+    def cellSize(self):
+        return min((self.width() - self.margin) / self.plate.cols,
+                   (self.height() - self.margin) / self.plate.rows)
+
+    def wellAt(self, pos):
+        cell = self.cellSize()
+        col = int((pos.x() - self.margin) // cell)
+        row = int((pos.y() - self.margin) // cell)
+        if 0 <= row < self.plate.rows and 0 <= col < self.plate.cols:
+            return row, col
+        return None
+
+    def wellsInRect(self, rect):
+        # wells whose center lies inside rect, as row and column slices
+        cell = self.cellSize()
+        c0 = max(0, int(np.ceil((rect.left() - self.margin) / cell - 0.5)))
+        c1 = min(self.plate.cols, int(np.floor((rect.right() - self.margin) / cell - 0.5)) + 1)
+        r0 = max(0, int(np.ceil((rect.top() - self.margin) / cell - 0.5)))
+        r1 = min(self.plate.rows, int(np.floor((rect.bottom() - self.margin) / cell - 0.5)) + 1)
+        return slice(r0, max(r0, r1)), slice(c0, max(c0, c1))
+
+    def wellCenter(self, row, col):
+        cell = self.cellSize()
+        return self.margin + (col + 0.5) * cell, self.margin + (row + 0.5) * cell
+
+    def mousePressEvent(self, event):
+        self.drag_start_pos = event.pos()
+        self.ctrl_pressed = bool(QApplication.keyboardModifiers() & Qt.ControlModifier)
+
+    def mouseMoveEvent(self, event):
+        if self.drag_start_pos is None:
+            return
+        self.drag_end_pos = event.pos()
+        self.update()
+
+    def mouseReleaseEvent(self, event):
+        if self.drag_start_pos is None:
+            return
+        if self.drag_end_pos is None or (event.pos() - self.drag_start_pos).manhattanLength() < 4:
+            well = self.wellAt(event.pos())
+            if well is not None:
+                self.selection[well] = not self.selection[well]
+        else:
+            # Clearing previous selection unless Ctrl key is pressed
+            if not self.ctrl_pressed:
+                self.selection[:] = False
+            rows, cols = self.wellsInRect(QRect(self.drag_start_pos, event.pos()).normalized())
+            self.selection[rows, cols] = True
+        self.drag_start_pos = None
+        self.drag_end_pos = None
+        self.update()
+        self.selectionChanged.emit()
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.setRenderHint(QPainter.Antialiasing)
+        cell = self.cellSize()
+        radius = cell * 0.45
+
+        # only wells intersecting the exposed area are drawn
+        rows, cols = self.wellsInRect(QRectF(event.rect()).adjusted(-cell, -cell, cell, cell))
+        painter.setPen(QPen(Qt.black, 1))
+        red = QBrush(Qt.red)
+        for row in range(rows.start, rows.stop):
+            for col in range(cols.start, cols.stop):
+                x, y = self.wellCenter(row, col)
+                painter.setBrush(red if self.selection[row, col] else Qt.NoBrush)
+                painter.drawEllipse(QRectF(x - radius, y - radius, 2 * radius, 2 * radius))
+
+        # row/column labels, thinned out when the wells get small
+        step = max(1, int(np.ceil(14 / cell)))
+        painter.setPen(QColor(60, 60, 60))
+        for col in range(0, self.plate.cols, step):
+            x, _ = self.wellCenter(0, col)
+            painter.drawText(QRectF(x - cell, 0, 2 * cell, self.margin), Qt.AlignCenter, str(col + 1))
+        for row in range(0, self.plate.rows, step):
+            _, y = self.wellCenter(row, 0)
+            painter.drawText(QRectF(0, y - cell, self.margin, 2 * cell), Qt.AlignCenter, self.plate.row_label(row))
+
+        if self.overlay is None:
+            self.renderOverlay()
+        painter.drawImage(0, 0, self.overlay)
+
+        if self.drag_start_pos and self.drag_end_pos:
+            painter.setPen(QPen(Qt.blue, 2, Qt.SolidLine))
+            painter.setBrush(Qt.NoBrush)
+            selection_rect = QRect(self.drag_start_pos, self.drag_end_pos).normalized()
+            painter.drawRect(selection_rect)
+
 
 class WellPlateSelector(QWidget):
     def __init__(self):
@@ -14,15 +186,21 @@ class WellPlateSelector(QWidget):
         self.offset = {'x':48510,'y':-31800}
         self.PSF = 7050
         self.well_to_well_distance = 9
+        self.fov = 326 # um, 2040 px at 0.160 um/px
+        self.overlap = 5 # %
+        self.plate = PLATE_FORMATS['96']
+        self._site_params = None
+        self._site_cache = {}
+        self._pattern = None
         self.initUI()
-        self.drag_start_pos = None
-        self.ctrl_pressed = False
-        self.drag_end_pos = None
 
     def initUI(self):
-        self.selected_wells = set()
+        self.preview_timer = QTimer(self)
+        self.preview_timer.setSingleShot(True)
+        self.preview_timer.setInterval(150)
+        self.preview_timer.timeout.connect(self.refreshPreview)
 
-        self.setWindowTitle('96-Well Plate Selector')
+        self.setWindowTitle(f'{self.plate.n_wells}-Well Plate Selector')
         self.setGeometry(100, 100, 800, 600)
 
         main_layout = QHBoxLayout()
@@ -30,50 +208,50 @@ class WellPlateSelector(QWidget):
         # Left Side Layout
         left_layout = QVBoxLayout()
 
-        grid_layout = QGridLayout()
-        self.button_grid = []
-
-        rows = 'ABCDEFGH'
-        columns = range(1, 13)
-
-        for i, row_char in enumerate(rows):  # Alphabetic rows
-            row = []
-            for j, col_num in enumerate(columns):  # Numeric columns
-                label = f'{row_char}{col_num}'
-                button = QPushButton(label)
-                button.setFixedSize(50, 50)
-                button.clicked.connect(self.buttonClicked)
-                button.setCheckable(True)
-                
-                # Set button style to make it circular
-                button.setStyleSheet("QPushButton {"
-                                      "border-radius: 25px;"
-                                      "border: 2px solid black;"
-                                      "}"
-                                      "QPushButton::pressed"
-                                      "{"
-                                      "background-color : yellow;"
-                                      "}"
-                                      "QPushButton::checked"
-                                      "{"
-                                      "background-color : red;"
-                                      "}")
-                
-                row.append(button)
-                grid_layout.addWidget(button, i, j)
-            self.button_grid.append(row)
-
-        left_layout.addLayout(grid_layout)
+        format_layout = QHBoxLayout()
+        format_layout.addWidget(QLabel('Plate Format:'))
+        self.format_selector = QComboBox()
+        self.format_selector.addItems(list(PLATE_FORMATS))
+        self.format_selector.currentTextChanged.connect(self.changeFormat)
+        format_layout.addWidget(self.format_selector)
+        left_layout.addLayout(format_layout)
+
+        self.plate_view = PlateView(self.plate)
+        self.plate_view.selectionChanged.connect(self.updateOutput)
+        self.plate_view.selectionChanged.connect(self.schedulePreview)
+        left_layout.addWidget(self.plate_view, 1)
 
         self.output_label = QLabel('Selected Wells: ')
+        self.output_label.setWordWrap(True)
         left_layout.addWidget(self.output_label)
 
+        self.status_label = QLabel('')
+        self.status_label.setStyleSheet('color: red;')
+        self.status_label.setWordWrap(True)
+        left_layout.addWidget(self.status_label)
+
+        # stage range check and run time of the last saved list
+        self.check_label = QLabel('')
+        self.check_label.setWordWrap(True)
+        left_layout.addWidget(self.check_label)
+
         # Save File Button
         self.save_button = QPushButton('Save File')
         self.save_button.clicked.connect(self.saveToFile)
         left_layout.addWidget(self.save_button)
 
-        main_layout.addLayout(left_layout)
+        self.save_spec_button = QPushButton('Save Layout Spec')
+        self.save_spec_button.clicked.connect(self.saveSpec)
+        left_layout.addWidget(self.save_spec_button)
+
+        self.focus_points = None
+        self.focus_button = QPushButton('Load Focus Points...')
+        self.focus_button.clicked.connect(self.loadFocusPoints)
+        left_layout.addWidget(self.focus_button)
+        self.focus_label = QLabel('Z: 100 um for every point')
+        left_layout.addWidget(self.focus_label)
+
+        main_layout.addLayout(left_layout, 1)
 
         # Right Side Layout
         right_layout = QVBoxLayout()
@@ -106,10 +284,66 @@ class WellPlateSelector(QWidget):
         self.PSF_slider = self.createSlider_int('PSF', 0, 20000, self.PSF)
         right_layout.addLayout(self.PSF_slider)
 
+        # FOV size and overlap, used by the Hex/Rings/Spiral coverage layouts
+        self.fov_slider = self.createSlider_int('FOV Size in um', 50, 3000, self.fov)
+        right_layout.addLayout(self.fov_slider)
+        self.overlap_slider = self.createSlider_int('FOV Overlap in %', 0, 50, self.overlap)
+        right_layout.addLayout(self.overlap_slider)
+
+        # Site pattern: Random is drawn per well unless the same pattern is used everywhere,
+        # deterministic patterns are always computed once and shifted to every well
+        pattern_layout = QHBoxLayout()
+        pattern_layout.addWidget(QLabel('Site Pattern:'))
+        self.pattern_selector = QComboBox()
+        self.pattern_selector.addItems(['Random', 'Grid', 'Hex', 'Rings', 'Spiral'])
+        self.pattern_selector.currentTextChanged.connect(self.schedulePreview)
+        pattern_layout.addWidget(self.pattern_selector)
+        right_layout.addLayout(pattern_layout)
+
+        self.fill_well_checkbox = QCheckBox('Fill whole well (Hex/Rings/Spiral)')
+        self.fill_well_checkbox.stateChanged.connect(self.schedulePreview)
+        right_layout.addWidget(self.fill_well_checkbox)
+
+        self.max_sites_label = QLabel('')
+        self.max_sites_key = None
+        right_layout.addWidget(self.max_sites_label)
+
+        self.same_pattern_checkbox = QCheckBox('Same sites in every well')
+        self.same_pattern_checkbox.stateChanged.connect(self.schedulePreview)
+        right_layout.addWidget(self.same_pattern_checkbox)
+
+        seed_layout = QHBoxLayout()
+        seed_layout.addWidget(QLabel('Random Seed:'))
+        self.seed_spinbox = QSpinBox()
+        self.seed_spinbox.setRange(-1, 2**31 - 1)
+        self.seed_spinbox.setValue(-1)
+        self.seed_spinbox.setSpecialValueText('none')
+        self.seed_spinbox.valueChanged.connect(self.schedulePreview)
+        seed_layout.addWidget(self.seed_spinbox)
+        right_layout.addLayout(seed_layout)
+
+        order_layout = QHBoxLayout()
+        order_layout.addWidget(QLabel('Acquisition Order:'))
+        self.order_selector = QComboBox()
+        # item text -> plate_layout spec 'order'
+        self.order_selector.addItem('Row snake', 'snake')
+        self.order_selector.addItem('Shortest travel (well by well)', 'travel')
+        order_layout.addWidget(self.order_selector)
+        right_layout.addLayout(order_layout)
+
+        stations_layout = QHBoxLayout()
+        stations_layout.addWidget(QLabel('Microscopes:'))
+        self.stations_spinbox = QSpinBox()
+        self.stations_spinbox.setRange(1, 16)
+        self.stations_spinbox.setToolTip('More than one saves a list per microscope, balanced by run time')
+        stations_layout.addWidget(self.stations_spinbox)
+        right_layout.addLayout(stations_layout)
+
         main_layout.addLayout(right_layout)
 
 
         self.setLayout(main_layout)
+        self.updateMaxSites()
     def createSlider_float(self, label, min_val, max_val, default_val):
         slider_layout = QVBoxLayout()
 
@@ -147,253 +381,193 @@ class WellPlateSelector(QWidget):
 
     def sliderChanged(self, value, label):
         label.setText(f'{label.text().split(":")[0]}: {value}')
+        self.schedulePreview()
 
-    # ... (rest of the methods remain the same)
-
-    def buttonClicked(self):
-        button = self.sender()
-        index = self.getButtonIndex(button)
-
-        if button.isChecked():
-            self.selected_wells.add(index)
-        else:
-            self.selected_wells.discard(index)
+    def updateMaxSites(self, *args):
+        # sliders fire while the UI is still being built
+        if not hasattr(self, 'max_sites_label'):
+            return
+        pattern = self.pattern_selector.currentText()
+        well_diameter = self.well_diameter_slider.itemAt(1).widget().value() / 100.0
+        fov = self.fov_slider.itemAt(1).widget().value()
+        # Rings and Spiral take a while on big wells, so only when one of these changed
+        key = (pattern, well_diameter, fov)
+        if key == self.max_sites_key:
+            return
+        self.max_sites_key = key
+        if pattern not in ('Hex', 'Rings', 'Spiral'):
+            self.max_sites_label.setText('')
+            return
+        n = max_sites(pattern, well_diameter*1000, fov)
+        self.max_sites_label.setText(f'Max non-overlapping FOVs per well: {n}')
 
-        self.updateOutput()
+    def changeFormat(self, name):
+        self.plate = PLATE_FORMATS[name]
+        self.setWindowTitle(f'{self.plate.n_wells}-Well Plate Selector')
+        self.well_to_well_distance_slider.itemAt(1).widget().setValue(int(self.plate.pitch * 100))
+        diameter_slider = self.well_diameter_slider.itemAt(1).widget()
+        diameter_slider.setValue(min(diameter_slider.value(), int(self.plate.well_diameter * 100)))
+        self.plate_view.setGeometryModel(self.plate)
 
-    def getButtonIndex(self, button):
-        for i, row in enumerate(self.button_grid):
-            for j, btn in enumerate(row):
-                if btn is button:
-                    return i*12 + j + 1
-        return -1
+    @property
+    def selected_wells(self):
+        return set((np.flatnonzero(self.plate_view.selection) + 1).tolist())
 
     def updateOutput(self):
-        # mapped_wells = [self.mapIndexToWellID(index) for index in sorted(self.selected_wells)]
         ordered_indices = self.getSnakeOrderedWells()
         mapped_wells = [self.mapIndexToWellID(index) for index in ordered_indices]
         selected_wells_str = ', '.join(mapped_wells)
-        self.output_label.setText(f'Selected Wells: {selected_wells_str}')
+        self.output_label.setText(f'Selected Wells ({len(mapped_wells)}): {selected_wells_str}')
 
     def mapIndexToWellID(self, index):
-        print(self.selected_wells, self.well_diameter_slider.itemAt(1).widget().value() / 100.0 )
-        row = 'ABCDEFGH'[(index -1) // 12]
-        col = (index )% 12
-        if col == 0:
-            col = 12
-        return f'{row}{col}'
+        return self.plate.well_id(index)
 
     def getSnakeOrderedWells(self):
-        rows = 'ABCDEFGH'
-        cols = list(range(1, 13))
-
-        # Create a dictionary to group selected wells by row
-        wells_by_row = {r: [] for r in rows}
-
-        for index in self.selected_wells:
-            row_char = rows[(index - 1) // 12]
-            col_num = (index % 12)
-            if col_num == 0:
-                col_num = 12
-            wells_by_row[row_char].append(col_num)
-
-        ordered_indices = []
-
-        for i, row in enumerate(rows):
-            cols_in_row = wells_by_row[row]
-            if not cols_in_row:
-                continue
-            # Sort columns in desired order
-            if i % 2 == 0:
-                cols_in_row_sorted = sorted(cols_in_row)
-            else:
-                cols_in_row_sorted = sorted(cols_in_row, reverse=True)
-
-            for col in cols_in_row_sorted:
-                # Calculate index again: row * 12 + col
-                idx = i * 12 + col
-                ordered_indices.append(idx)
-
-        return ordered_indices
-
-    def wells_to_coordinates(self):
-        import numpy as np
-        import pandas as pd
-        def generate_coordinates(x_center, y_center, diameter, euclidean_distance, num_points=10):
-            import math,random
-            coordinates = []
-            
-            while len(coordinates) < num_points:
-                x = random.uniform(x_center - diameter/2, x_center + diameter/2)
-                y = random.uniform(y_center - diameter/2, y_center + diameter/2)
-                
-                valid = True
-                for coord in coordinates:
-                    distance = math.sqrt((x - coord[0])**2 + (y - coord[1])**2)
-                    if distance < euclidean_distance:
-                        valid = False
-                        break
-                        
-                if valid:
-                    coordinates.append((x, y))
-            
-            return coordinates
-
+        return snake_order(self.plate_view.selection)
 
+    def readSliders(self):
         #todo get from sliders
         self.number_per_well = self.number_per_well_slider.itemAt(1).widget().value()
         self.well_diameter = self.well_diameter_slider.itemAt(1).widget().value() / 100.0
         self.distance = self.distance_slider.itemAt(1).widget().value()/ 100.0
+        self.well_to_well_distance = self.well_to_well_distance_slider.itemAt(1).widget().value() / 100.0
         self.offset = {'x':(self.offset_x_slider.itemAt(1).widget().value()),
                        'y':(self.offset_y_slider.itemAt(1).widget().value())}
         self.PSF = self.PSF_slider.itemAt(1).widget().value()
-        print(self.well_diameter,self.distance,self.offset)
-        #transform A1 to H12 to [1*number*offset , 1* letter*offset]
-        #ord('D')-ord('A')
-        lista = []
-        
-        # for _well in self.selected_wells:
-        ordered_indices = self.getSnakeOrderedWells()
-        for _well in ordered_indices:
-            #col, x
-            print('selected wells:', _well)
-            lista.append([self.mapIndexToWellID(_well), 
-                          #           Y
-                          #          -30
-                          #           ^
-                          #           |
-                          #           |
-                          #           |
-                          #           |
-                          #           |
-                          # 48<-------x-----> -48
-                          #           |
-                          #           |
-                          #           |
-                          #           |
-                          #           |
-                          #           30  
-                          #X coordinates reduce when moving top down
-                          # pos neg pos again....
-                          #index starts at 1 somehow?
-                          
-                          ((self.offset['x']/1000.0) - (((_well-1) %12 )*  self.well_to_well_distance)) *1000,
-                          #y coordinates are negative on the left and positive moving to the right
-                          ((self.offset['y']/1000.0) + (((_well-1) // 12) * self.well_to_well_distance)) *1000,
-                          self.PSF ])
-            
-            #row, y
-        # lista_final = lista
-        lista_final = []
-        
-        for sub_well in lista:
-            #if you want all random coords offset to be the same in all wells, move this up
-            _coords = np.asarray(generate_coordinates(sub_well[1],sub_well[2], 
-                                self.well_diameter*1000,
-                                self.distance*2000,
-                                num_points = self.number_per_well)
-                            )
-            for i in range(self.number_per_well):
-                lista_final.append([ sub_well[0]+'_'+str(i) , #name
-                                _coords[i,0], #x are mm and xml uses um
-                                _coords[i,1], #y are mm and xml uses um
-                                sub_well[3], #PSF
-                ]
-                )
-        
-            
-        df = pd.DataFrame(lista_final,columns=['name','x','y',"PSF"])
-        df.sort_values(by=['name'])
-        return df
-    
-    def dataframe_to_xml(self,df):
-        xml_lines = [
-            '<variant version="1.0">',
-            '<no_name runtype="CLxListVariant">',
-            '<bIncludeZ runtype="bool" value="false"/>',
-            '<bPFSEnabled runtype="bool" value="true"/>'
-        ]
-
-        for idx, row in df.iterrows():
-            point_xml = [
-                f'<Point{idx:05d} runtype="NDSetupMultipointListItem">',
-                '<bChecked runtype="bool" value="true"/>',
-                f'<strName runtype="CLxStringW" value="{row["name"]}"/>',
-                f'<dXPosition runtype="double" value="{row["x"]}"/>',
-                f'<dYPosition runtype="double" value="{row["y"]}"/>',
-                '<dZPosition runtype="double" value="100"/>',  # Constant Z position
-                f'<dPFSOffset runtype="double" value="{row["PSF"]}"/>',
-                '<baUserData runtype="CLxByteArray" value=""/>',
-                '</Point{:05d}>'.format(idx)
-            ]
-            xml_lines.extend(point_xml)
-
-        xml_lines.extend([
-            '</no_name>',
-            '</variant>'
-        ])
-
-        xml_str = '\n'.join(xml_lines)
-        return xml_str
-
+        self.fov = self.fov_slider.itemAt(1).widget().value()
+        self.overlap = self.overlap_slider.itemAt(1).widget().value()
+
+    def layoutSpec(self):
+        """The current settings as a plate layout spec (see plate_layout.DEFAULT_SPEC)."""
+        seed = self.seed_spinbox.value()
+        return {
+            'format': self.format_selector.currentText(),
+            'wells': [self.mapIndexToWellID(i) for i in self.getSnakeOrderedWells()],
+            'number_per_well': self.number_per_well,
+            'well_diameter': self.well_diameter,
+            'distance': self.distance,
+            'well_to_well_distance': self.well_to_well_distance,
+            'offset': dict(self.offset),
+            'PSF': self.PSF,
+            'z': 100,
+            'pattern': self.pattern_selector.currentText(),
+            'same_pattern': self.same_pattern_checkbox.isChecked(),
+            'seed': None if seed < 0 else seed,
+            'fill_well': self.fill_well_checkbox.isChecked(),
+            'fov': self.fov,
+            'overlap': self.overlap,
+            'order': self.order_selector.currentData(),
+            'stations': self.stations_spinbox.value(),
+            'focus_points': self.focus_points,
+        }
+
+    def siteParameters(self, spec):
+        # everything that changes the sites around a well center (wells, offsets, pitch and PSF do not)
+        return tuple(spec[k] for k in ('pattern', 'same_pattern', 'seed', 'fill_well', 'number_per_well',
+                                       'well_diameter', 'distance', 'fov', 'overlap'))
+
+    def localSites(self, indices, time_limit=None):
+        """Sites relative to each well center in um, shape (len(indices), n, 2).
+
+        Sites are cached per well and only wells not generated yet with the
+        current parameters are computed, so selecting a few more wells does
+        not redraw the random sites of the others. Seeded random layouts are
+        regenerated for the whole selection to stay reproducible.
+        """
+        spec = self.layoutSpec()
+        params = self.siteParameters(spec)
+        if params != self._site_params:
+            self._site_params = params
+            self._site_cache = {}
+            self._pattern = None
+
+        missing = [i for i in indices if i not in self._site_cache]
+        # raises InfeasibleLayoutError if the sites cannot fit
+        if missing and spec['pattern'] == 'Random' and not spec['same_pattern']:
+            if spec['seed'] is not None:
+                missing = list(indices)
+            # all missing wells in one call
+            self._site_cache.update(zip(missing, local_sites(len(missing), spec, time_limit=time_limit)))
+        elif missing:
+            # one pattern, broadcast to every well center
+            if self._pattern is None:
+                self._pattern = layout_pattern(spec)
+            self._site_cache.update((i, self._pattern) for i in missing)
+
+        if not len(indices):
+            return np.empty((0, 0, 2))
+        return np.stack([self._site_cache[i] for i in indices])
+
+    def schedulePreview(self, *args):
+        # restarted on every change, so dragging a slider only recomputes once it settles
+        self.preview_timer.start()
+
+    def refreshPreview(self):
+        self.readSliders()
+        self.updateMaxSites()
+        indices = self.getSnakeOrderedWells()
+        try:
+            local = self.localSites(indices, time_limit=PREVIEW_TIME_LIMIT)
+            self.status_label.setText('')
+        except InfeasibleLayoutError as e:
+            local = None
+            self.status_label.setText(str(e))
+        self.plate_view.setSites(indices, local, self.fov, self.well_to_well_distance*1000)
 
+    def wells_to_coordinates(self):
+        # columns name/x/y/PSF; a plain dict of arrays so saving never has to import pandas
+        self.readSliders()
+        ordered_indices = self.getSnakeOrderedWells()
+        # the previewed sites are the ones saved
+        return layout_points(self.layoutSpec(), local=self.localSites(ordered_indices))
     
-    def mousePressEvent(self, event):
-        self.drag_start_pos = event.pos()
-        self.ctrl_pressed = QApplication.keyboardModifiers() & Qt.ControlModifier
-        
-        # Clearing previous selection unless Ctrl key is pressed
-        if not self.ctrl_pressed:
-            for row in self.button_grid:
-                for btn in row:
-                    btn.setChecked(False)
-
-    def mouseReleaseEvent(self, event):
-        if self.drag_start_pos is None:
+    def loadFocusPoints(self):
+        # a small NIS pointlist of positions focused by hand; cancel goes back to a constant Z
+        fileName, _ = QFileDialog.getOpenFileName(self, "Load Focus Points", "", "XML Files (*.xml);;All Files (*)")
+        if not fileName:
+            self.focus_points = None
+            self.focus_label.setText('Z: 100 um for every point')
             return
-        
-        drag_end_pos = event.pos()
-        
-        # Getting selection rectangle
-        selection_rect = QRect(self.drag_start_pos, drag_end_pos).normalized()
-        
-        for row in self.button_grid:
-            for btn in row:
-                if selection_rect.contains(btn.geometry().center()):
-                    btn.setChecked(True)
-                    self.selected_wells.add(self.getButtonIndex(btn))
-        
-        self.updateOutput()
-        self.drag_start_pos = None
-        self.drag_end_pos = None
-        self.update()
-
-    def mouseMoveEvent(self, event):
-        if self.drag_start_pos is None:
+        try:
+            surface = load_focus_surface(fileName)
+        except (ValueError, OSError, SyntaxError, np.linalg.LinAlgError) as e:
+            QMessageBox.warning(self, "Focus points", f"Cannot use {fileName}: {e}")
             return
+        self.focus_points = fileName
+        self.focus_label.setText(f'Z: {surface.describe()}')
 
-        self.drag_end_pos = event.pos()
-        self.update()
-
-    def paintEvent(self, event):
-        if self.drag_start_pos and self.drag_end_pos:
-            painter = QPainter(self)
-            painter.setPen(QPen(Qt.blue, 2, Qt.SolidLine))
-            selection_rect = QRect(self.drag_start_pos, self.drag_end_pos).normalized()
-            painter.drawRect(selection_rect)
+    def saveSpec(self):
+        # the same settings can then be generated headless with plate_layout.py
+        self.readSliders()
+        fileName, _ = QFileDialog.getSaveFileName(self, "Save Layout Spec", "", "JSON Files (*.json);;All Files (*)")
+        if fileName:
+            with open(fileName, 'w') as f:
+                json.dump(self.layoutSpec(), f, indent=2)
 
     def saveToFile(self):
         options = QFileDialog.Options()
         fileName, _ = QFileDialog.getSaveFileName(self, "Save Selected Wells", "", "Text Files (*.txt);;All Files (*)", options=options)
-        df = self.wells_to_coordinates()
-        print(df)
-        output_xml = (self.dataframe_to_xml(
-            df
-            # self.wells_to_coordinates()
-            ))
+        try:
+            df = self.wells_to_coordinates()
+        except InfeasibleLayoutError as e:
+            QMessageBox.warning(self, "Sites do not fit", str(e))
+            return
+        # sites closer than a FOV step overlap more than the overlap setting asks for
+        report = check_points(df, min_distance=self.fov * (1 - self.overlap / 100.0))
+        summary = format_summary(report)
+        self.check_label.setText(summary)
+        if report['errors']:
+            answer = QMessageBox.question(self, "Pointlist has errors", summary + "\n\nSave anyway?")
+            if answer != QMessageBox.Yes:
+                return
         if fileName:
-            with open(fileName, 'w') as f:
-                f.write(output_xml)
+            write_report(report, report_path(fileName))
+            if self.stations_spinbox.value() > 1:
+                manifest = write_stations(partition_points(df, self.stations_spinbox.value()), fileName,
+                                          include_z=self.focus_points is not None)
+                self.check_label.setText(summary + '\n' + format_manifest(manifest))
+            else:
+                write_pointlist(fileName, df, include_z=self.focus_points is not None)
                     
 if __name__ == '__main__':
     app = QApplication(sys.argv)
@@ -0,0 +1,193 @@
+import os
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+# NIS pointlist element -> column
+FLOAT_FIELDS = {
+    'dXPosition': 'x',
+    'dYPosition': 'y',
+    'dZPosition': 'z',
+    'dPFSOffset': 'PSF',
+}
+
+
+def _grow(columns, capacity):
+    for key, col in columns.items():
+        grown = np.empty(capacity, dtype=col.dtype)
+        grown[:len(col)] = col
+        columns[key] = grown
+
+
+def read_pointlist(path):
+    """Columns of a NIS Elements pointlist XML, parsed in one streaming pass.
+
+    Returns a dict of NumPy arrays: name (object), x, y, z, PSF (float64)
+    and checked (bool), in file order. Points are read with iterparse
+    straight into preallocated columns and cleared as soon as they close.
+    Missing fields fall back to z=0, PSF=0, checked=True and an empty
+    name; points without an X or Y position are dropped. Paths ending in
+    .gz are read through gzip.
+    """
+    # a point is ~400 bytes of XML, so this rarely has to grow
+    capacity = max(16, os.path.getsize(path) // 300)
+    columns = {
+        'name': np.empty(capacity, dtype=object),
+        'x': np.empty(capacity),
+        'y': np.empty(capacity),
+        'z': np.empty(capacity),
+        'PSF': np.empty(capacity),
+        'checked': np.empty(capacity, dtype=bool),
+    }
+    n = 0
+    x, y, z, psf = columns['x'], columns['y'], columns['z'], columns['PSF']
+
+    source = path
+    if os.fspath(path).endswith('.gz'):
+        import gzip
+        source = gzip.open(path, 'rb')
+
+    # only 'end' events: when a Point closes all of its fields are already parsed
+    for _, elem in ET.iterparse(source):
+        if not elem.tag.startswith('Point'):
+            continue
+        if n == capacity:
+            capacity *= 2
+            _grow(columns, capacity)
+            x, y, z, psf = columns['x'], columns['y'], columns['z'], columns['PSF']
+        x[n] = y[n] = np.nan
+        z[n] = psf[n] = 0.0
+        name = ''
+        checked = True
+        for child in elem:
+            value = child.get('value')
+            if value is None:
+                continue
+            field = FLOAT_FIELDS.get(child.tag)
+            if field is not None:
+                try:
+                    columns[field][n] = float(value)
+                except ValueError:
+                    pass
+            elif child.tag == 'strName':
+                name = value.strip()
+            elif child.tag == 'bChecked':
+                checked = value.strip().lower() != 'false'
+        columns['name'][n] = name
+        columns['checked'][n] = checked
+        n += 1
+        # the columns hold what is needed, free the point's subtree
+        elem.clear()
+
+    if source is not path:
+        source.close()
+
+    columns = {key: col[:n] for key, col in columns.items()}
+    valid = ~(np.isnan(columns['x']) | np.isnan(columns['y']))
+    if not valid.all():
+        columns = {key: col[valid] for key, col in columns.items()}
+    return columns
+
+
+_HEADER = (
+    '<variant version="1.0">\n'
+    '<no_name runtype="CLxListVariant">\n'
+    '<bIncludeZ runtype="bool" value="{0}"/>\n'
+    '<bPFSEnabled runtype="bool" value="true"/>\n'
+)
+_FOOTER = '</no_name>\n</variant>'
+_POINT = (
+    '<Point{0:05d} runtype="NDSetupMultipointListItem">\n'
+    '<bChecked runtype="bool" value="{1}"/>\n'
+    '<strName runtype="CLxStringW" value="{2}"/>\n'
+    '<dXPosition runtype="double" value="{3}"/>\n'
+    '<dYPosition runtype="double" value="{4}"/>\n'
+    '<dZPosition runtype="double" value="{5}"/>\n'
+    '<dPFSOffset runtype="double" value="{6}"/>\n'
+    '<baUserData runtype="CLxByteArray" value=""/>\n'
+    '</Point{0:05d}>\n'
+)
+_ESCAPES = {'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;'}
+
+
+def _escape(name):
+    name = str(name)
+    if any(ch in name for ch in _ESCAPES):
+        name = ''.join(_ESCAPES.get(ch, ch) for ch in name)
+    return name
+
+
+def _format_numbers(values, precision):
+    # None keeps the shortest round-trip repr, the same text str(float) gives
+    values = np.asarray(values)
+    if precision is None:
+        return list(map(str, values.tolist()))
+    return list(map(f'{{:.{precision}f}}'.format, values.astype(float).tolist()))
+
+
+def write_pointlist(target, columns, precision=None, compress=None, chunk_size=4096, include_z=False):
+    """Stream columns to a NIS Elements pointlist XML.
+
+    target is a path or an open text file. columns maps x and y (required)
+    and optionally name, z, PSF and checked to sequences or arrays (a dict
+    of arrays, a DataFrame, ...). Missing columns default to names P01,
+    P02, ..., z=0, PSF=0 and checked=True. Points are formatted and written
+    chunk_size at a time, so memory stays flat however long the list is.
+    precision sets the number of decimals for the coordinates.
+    include_z=True makes NIS move to each point's Z, e.g. one from a focus
+    surface; otherwise the Z column is written but ignored.
+    compress=True (or a path ending in .gz) writes gzip.
+    Returns the number of points written.
+    """
+    if isinstance(target, (str, os.PathLike)):
+        if compress is None:
+            compress = os.fspath(target).endswith('.gz')
+        if compress:
+            import gzip
+            f = gzip.open(target, 'wt', encoding='utf-8')
+        else:
+            f = open(target, 'w', encoding='utf-8', buffering=1 << 20)
+        with f:
+            return write_pointlist(f, columns, precision=precision, chunk_size=chunk_size, include_z=include_z)
+
+    f = target
+    n = len(columns['x'])
+
+    def column(key, default):
+        try:
+            values = columns[key]
+        except KeyError:
+            return None if default is None else np.full(n, default)
+        return np.asarray(values)
+
+    names = column('name', None)
+    z = column('z', 0.0)
+    psf = column('PSF', 0.0)
+    checked = column('checked', True)
+
+    f.write(_HEADER.format('true' if include_z else 'false'))
+    for start in range(0, n, chunk_size):
+        stop = min(n, start + chunk_size)
+        idx = range(start, stop)
+        if names is None:
+            chunk_names = [f'P{i + 1:02d}' for i in idx]
+        else:
+            chunk_names = [_escape(name) for name in names[start:stop]]
+        chk = checked[start:stop]
+        if chk.dtype == bool:
+            chk = np.where(chk, 'true', 'false')
+        f.write(''.join(map(_POINT.format, idx, chk, chunk_names,
+                            _format_numbers(columns['x'][start:stop], precision),
+                            _format_numbers(columns['y'][start:stop], precision),
+                            _format_numbers(z[start:stop], precision),
+                            _format_numbers(psf[start:stop], precision))))
+    f.write(_FOOTER)
+    return n
+
+
+def pointlist_to_string(columns, precision=None, include_z=False):
+    """The pointlist XML as one string, for callers that need the text rather than a file."""
+    import io
+    buf = io.StringIO()
+    write_pointlist(buf, columns, precision=precision, include_z=include_z)
+    return buf.getvalue()
@@ -0,0 +1,83 @@
+import numpy as np
+
+# cell offsets that, together with the cell itself, see every neighbouring
+# cell exactly once (the other four are covered from the other side)
+_FORWARD = ((0, 1), (1, -1), (1, 0), (1, 1))
+
+
+def _ranges(starts, counts):
+    """Concatenation of range(start, start + count) for each start, without a Python loop."""
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return np.repeat(starts, counts) + offsets
+
+
+def close_pairs(x, y, radius):
+    """Index pairs (i, j), i < j, of points closer than radius.
+
+    Uses a uniform grid with radius-sized cells: points are sorted by cell,
+    and each cell is only compared with itself and four forward neighbours,
+    so the work grows with the number of points, not its square.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if n < 2 or radius <= 0:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+
+    cx = np.floor((x - x.min()) / radius).astype(np.int64)
+    cy = np.floor((y - y.min()) / radius).astype(np.int64)
+    stride = cy.max() + 3  # room for dy = -1 and +1 without wrapping into the next column
+    key = cx * stride + cy + 1
+    order = np.argsort(key, kind='stable')
+    sorted_key = key[order]
+
+    pos = np.arange(n)
+    # same cell: each point with the points after it in its run of equal keys
+    counts = np.searchsorted(sorted_key, sorted_key, side='right') - pos - 1
+    firsts = [np.repeat(pos, counts)]
+    seconds = [_ranges(pos + 1, counts)]
+    for dx, dy in _FORWARD:
+        target = sorted_key + dx * stride + dy
+        lo = np.searchsorted(sorted_key, target, side='left')
+        counts = np.searchsorted(sorted_key, target, side='right') - lo
+        firsts.append(np.repeat(pos, counts))
+        seconds.append(_ranges(lo, counts))
+
+    i = order[np.concatenate(firsts)]
+    j = order[np.concatenate(seconds)]
+    close = (x[i] - x[j]) ** 2 + (y[i] - y[j]) ** 2 < radius * radius
+    i, j = i[close], j[close]
+    return np.minimum(i, j), np.maximum(i, j)
+
+
+def duplicate_mask(x, y, radius):
+    """True for points that are closer than radius to an earlier point that is kept.
+
+    Points are taken in order, so the first of a group of overlapping
+    points is kept and the result does not depend on the index layout.
+    """
+    n = len(x)
+    drop = np.zeros(n, dtype=bool)
+    i, j = close_pairs(x, y, radius)
+    if not len(i):
+        return drop
+    # earlier neighbours of each later point, grouped by the later point
+    order = np.lexsort((i, j))
+    i, j = i[order], j[order]
+    later, starts = np.unique(j, return_index=True)
+    bounds = np.append(starts, len(j))
+    # a point only needs checking if it has an earlier neighbour, usually a small share
+    for k, point in enumerate(later.tolist()):
+        if not drop[i[bounds[k]:bounds[k + 1]]].all():
+            drop[point] = True
+    return drop
+
+
+def dedupe_points(columns, radius):
+    """Columns without points closer than radius (um) to an earlier point; returns (columns, removed)."""
+    drop = duplicate_mask(columns['x'], columns['y'], radius)
+    removed = int(drop.sum())
+    if removed:
+        keep = ~drop
+        columns = {key: np.asarray(col)[keep] for key, col in columns.items()}
+    return columns, removed
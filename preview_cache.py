@@ -0,0 +1,94 @@
+"""On-disk cache of overview planes prepared for display by the ROI selector.
+
+Each plane shown is saved as .npy files (the preview and any pyramid
+levels) with a small JSON of the metadata the selector needs, keyed by the
+ND2's path, size and modification time plus the scene/channel/Z shown.
+Reopening the file maps the arrays from disk instead of decoding the ND2.
+The cache is trimmed to a size limit, least recently used planes first.
+"""
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+# bump when the stored preview changes, old entries are then simply not found
+CACHE_VERSION = 3
+
+DEFAULT_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'lowcosthca', 'previews')
+DEFAULT_MAX_BYTES = 4 << 30
+
+
+class PreviewCache:
+    """Preview planes (plus metadata) on disk, at most max_bytes, LRU eviction."""
+
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory or os.environ.get('LOWCOSTHCA_PREVIEW_CACHE', DEFAULT_DIR)
+        self.max_bytes = max_bytes
+
+    def key(self, path, plane):
+        st = os.stat(path)
+        ident = json.dumps([CACHE_VERSION, os.path.abspath(path), st.st_size, st.st_mtime_ns, list(plane)])
+        return hashlib.sha1(ident.encode()).hexdigest()
+
+    def get(self, path, plane):
+        """(levels as read-only memory maps, metadata dict) or None if not cached."""
+        try:
+            entry = os.path.join(self.directory, self.key(path, plane))
+            with open(os.path.join(entry, 'meta.json')) as f:
+                meta = json.load(f)
+            levels = [np.load(os.path.join(entry, f'level{k}.npy'), mmap_mode='r') for k in range(meta['levels'])]
+        except (OSError, ValueError, KeyError):
+            return None
+        # the entry's mtime is its last use
+        os.utime(entry)
+        return levels, meta
+
+    def put(self, path, plane, levels, meta):
+        """Store the levels of a plane; returns them memory mapped from the cache (or as given if that fails)."""
+        key = self.key(path, plane)
+        entry = os.path.join(self.directory, key)
+        tmp = entry + f'.tmp{os.getpid()}'
+        try:
+            os.makedirs(tmp, exist_ok=True)
+            for k, level in enumerate(levels):
+                np.save(os.path.join(tmp, f'level{k}.npy'), level)
+            with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+                json.dump(dict(meta, levels=len(levels), created=time.time()), f)
+            if os.path.exists(entry):
+                shutil.rmtree(entry)
+            os.replace(tmp, entry)
+        except OSError:
+            # a full or read-only disk only costs the speed-up
+            shutil.rmtree(tmp, ignore_errors=True)
+            return levels
+        self.trim(keep=key)
+        cached = self.get(path, plane)
+        return cached[0] if cached else levels
+
+    def entries(self):
+        """(last use, bytes, directory) of every entry, oldest first."""
+        found = []
+        if not os.path.isdir(self.directory):
+            return found
+        for name in os.listdir(self.directory):
+            entry = os.path.join(self.directory, name)
+            if not os.path.isdir(entry) or '.tmp' in name:
+                continue
+            size = sum(e.stat().st_size for e in os.scandir(entry) if e.is_file())
+            found.append((os.stat(entry).st_mtime, size, entry))
+        return sorted(found)
+
+    def trim(self, keep=None):
+        """Remove least recently used entries until the cache fits max_bytes."""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in entries:
+            if total <= self.max_bytes:
+                break
+            if os.path.basename(entry) == keep:
+                continue
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
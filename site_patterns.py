@@ -0,0 +1,450 @@
+import time
+
+import numpy as np
+
+from pointlist_ops import close_pairs
+
+
+class InfeasibleLayoutError(ValueError):
+    """Raised when the requested sites cannot fit inside a well."""
+
+
+# 5x5 block of grid cells around a candidate, enough to see every neighbour
+# closer than min_distance when the cell size is min_distance / sqrt(2)
+_NEIGHBOUR_DY, _NEIGHBOUR_DX = (a.ravel() for a in np.mgrid[-2:3, -2:3])
+# 3x3 block of pitch-sized cells, for the square FOVs of the coverage layouts
+_CELL_DY, _CELL_DX = (a.ravel() for a in np.mgrid[-1:2, -1:2])
+
+# below this share of max_poisson_sites every maximal fill measured had room (the fewest was ~0.37)
+_PROBE_FRACTION = 1 / 3
+# wells filled by the feasibility probe, in one lockstep Bridson run
+_PROBE_WELLS = 16
+
+# candidate positions per pitch of ring or spiral tried by the coverage layouts
+_CANDIDATES_PER_PITCH = 8
+
+
+def max_poisson_sites(diameter, min_distance):
+    """Upper bound on sites with spacing min_distance in a diameter x diameter square.
+
+    Hexagonal packing of the disks of radius min_distance/2 centred on the
+    sites; nothing random can do better, so anything above it is infeasible.
+    """
+    if min_distance <= 0:
+        return np.inf
+    side = diameter + min_distance
+    return int(np.floor(side * side / (np.sqrt(3) / 2 * min_distance * min_distance)))
+
+
+def check_poisson_feasible(diameter, min_distance, num_points):
+    limit = max_poisson_sites(diameter, min_distance)
+    if num_points > limit:
+        raise InfeasibleLayoutError(
+            f'{num_points} sites {min_distance:.0f} apart cannot fit in a {diameter:.0f} wide well '
+            f'(at most {limit} even with perfect packing)')
+
+
+def _check_deadline(deadline, num_points, min_distance, diameter):
+    if deadline is not None and time.monotonic() > deadline:
+        raise InfeasibleLayoutError(
+            f'no layout of {num_points} sites {min_distance:.0f} apart in a {diameter:.0f} wide well '
+            f'found in time; try fewer sites or a smaller distance')
+
+
+def _bridson_fill(n_wells, diameter, min_distance, rng, k=30, deadline=None, num_points=None):
+    """Fill n_wells squares of side diameter with a maximal Poisson-disk set.
+
+    Bridson's algorithm run in lockstep over all wells: every iteration picks
+    one active point per well, throws k candidates in the annulus [r, 2r]
+    around it and checks them against the 5x5 background-grid neighbourhood
+    with a single NumPy gather. Returns points local to the square
+    (0..diameter) as (n_wells, cap, 2) and the count per well. Past
+    deadline (time.monotonic) it raises InfeasibleLayoutError.
+    """
+    r = float(min_distance)
+    cell = r / np.sqrt(2)
+    g = max(1, int(np.ceil(diameter / cell)))
+    cap = g * g
+
+    # grid is padded by 2 cells on each side so neighbourhood lookups never go out of bounds
+    grid = np.full((n_wells, g + 4, g + 4), -1, dtype=np.intp)
+    pts = np.zeros((n_wells, cap, 2))
+    count = np.ones(n_wells, dtype=np.intp)
+    active = np.zeros((n_wells, cap), dtype=np.intp)
+    n_active = np.ones(n_wells, dtype=np.intp)
+    wells = np.arange(n_wells)
+
+    seed = rng.uniform(0, diameter, (n_wells, 2))
+    pts[:, 0] = seed
+    gi = np.minimum((seed // cell).astype(np.intp), g - 1) + 2
+    grid[wells, gi[:, 1], gi[:, 0]] = 0
+
+    while True:
+        _check_deadline(deadline, num_points, min_distance, diameter)
+        live = np.flatnonzero(n_active)
+        if not len(live):
+            break
+        m = len(live)
+        slot = (rng.random(m) * n_active[live]).astype(np.intp)
+        parent = pts[live, active[live, slot]]
+
+        # uniform in area over the annulus r..2r
+        rad = r * np.sqrt(rng.uniform(1, 4, (m, k)))
+        ang = rng.uniform(0, 2 * np.pi, (m, k))
+        cand = parent[:, None, :] + np.stack((rad * np.cos(ang), rad * np.sin(ang)), axis=-1)
+        inside = np.all((cand >= 0) & (cand < diameter), axis=-1)
+
+        ci = np.clip((cand // cell).astype(np.intp), 0, g - 1) + 2
+        neigh = grid[live[:, None, None], ci[..., 1, None] + _NEIGHBOUR_DY, ci[..., 0, None] + _NEIGHBOUR_DX]
+        near = pts[live[:, None, None], np.maximum(neigh, 0)]
+        d2 = np.sum((near - cand[:, :, None, :]) ** 2, axis=-1)
+        ok = inside & ~np.any((neigh >= 0) & (d2 < r * r), axis=-1)
+
+        found = ok.any(axis=1)
+        if found.any():
+            acc = live[found]
+            new = cand[found, ok[found].argmax(axis=1)]
+            idx = count[acc]
+            pts[acc, idx] = new
+            gi = np.minimum((new // cell).astype(np.intp), g - 1) + 2
+            grid[acc, gi[:, 1], gi[:, 0]] = idx
+            active[acc, n_active[acc]] = idx
+            n_active[acc] += 1
+            count[acc] += 1
+
+        # parents that produced nothing are retired (swap with the last active point)
+        if not found.all():
+            rej = live[~found]
+            last = n_active[rej] - 1
+            active[rej, slot[~found]] = active[rej, last]
+            n_active[rej] = last
+
+    return pts, count
+
+
+def _dart_fill(n_wells, diameter, min_distance, num_points, rng, batch=64, max_rounds=50, deadline=None):
+    """Dart throwing against the same background grid, stopping at num_points.
+
+    Every round throws `batch` uniform darts per unfinished well, rejects the
+    ones too close to an accepted site (5x5 grid gather) or to an earlier dart
+    of the same round, and accepts the rest. This is the old rejection loop
+    made O(n) and batched; it gives up after max_rounds rounds and returns
+    whatever it got so that crowded wells can fall back to a full fill.
+    """
+    r = float(min_distance)
+    r2 = r * r
+    cell = r / np.sqrt(2)
+    g = max(1, int(np.ceil(diameter / cell)))
+
+    grid = np.full((n_wells, g + 4, g + 4), -1, dtype=np.intp)
+    pts = np.zeros((n_wells, num_points, 2))
+    count = np.zeros(n_wells, dtype=np.intp)
+    earlier = np.tri(batch, k=-1, dtype=bool).T
+
+    for _ in range(max_rounds):
+        _check_deadline(deadline, num_points, min_distance, diameter)
+        live = np.flatnonzero(count < num_points)
+        if not len(live):
+            break
+        m = len(live)
+        cand = rng.uniform(0, diameter, (m, batch, 2))
+        ci = np.minimum((cand // cell).astype(np.intp), g - 1) + 2
+        neigh = grid[live[:, None, None], ci[..., 1, None] + _NEIGHBOUR_DY, ci[..., 0, None] + _NEIGHBOUR_DX]
+        near = pts[live[:, None, None], np.minimum(np.maximum(neigh, 0), num_points - 1)]
+        d2 = np.sum((near - cand[:, :, None, :]) ** 2, axis=-1)
+        ok = ~np.any((neigh >= 0) & (d2 < r2), axis=-1)
+
+        clash = np.sum((cand[:, :, None] - cand[:, None]) ** 2, axis=-1) < r2
+        clash &= ok[:, :, None] & earlier
+        ok &= ~clash.any(axis=1)
+
+        # never take more than a well still needs
+        idx = count[live][:, None] + np.cumsum(ok, axis=1) - 1
+        ok &= idx < num_points
+        if not ok.any():
+            continue
+        rows = np.broadcast_to(live[:, None], ok.shape)[ok]
+        idx = idx[ok]
+        new = cand[ok]
+        pts[rows, idx] = new
+        gi = np.minimum((new // cell).astype(np.intp), g - 1) + 2
+        grid[rows, gi[:, 1], gi[:, 0]] = idx
+        count[live] += ok.sum(axis=1)
+
+    return pts, count
+
+
+def poisson_disk_sites(centers, diameter, min_distance, num_points, rng=None, attempts=3, time_limit=None):
+    """Random sites at least min_distance apart around every well center.
+
+    All wells are generated in one call and the result has shape
+    (len(centers), num_points, 2). Wells are first filled by batched dart
+    throwing; wells where that stalls (num_points close to what fits) get a
+    maximal Bridson fill and num_points of its sites drawn uniformly, which
+    always terminates.
+
+    Raises InfeasibleLayoutError when the sites cannot fit: up front when
+    num_points is above the packing bound, or, close to it, when so few
+    maximal fills of a probe of _PROBE_WELLS wells reach num_points that
+    `attempts` fills would leave wells short; otherwise when all wells were
+    tried and some came up short. With time_limit (s) it also raises once
+    that time is used up, for interactive previews.
+    """
+    centers = np.asarray(centers, dtype=float).reshape(-1, 2)
+    n_wells = len(centers)
+    rng = np.random.default_rng(rng)
+    check_poisson_feasible(diameter, min_distance, num_points)
+    if n_wells == 0 or num_points == 0:
+        return np.empty((n_wells, num_points, 2))
+
+    if min_distance <= 0:
+        local = rng.uniform(0, diameter, (n_wells, num_points, 2))
+        return centers[:, None, :] - diameter / 2 + local
+    deadline = None if time_limit is None else time.monotonic() + time_limit
+
+    if num_points > _PROBE_FRACTION * max_poisson_sites(diameter, min_distance):
+        # near capacity: see how often a maximal fill has room before filling every well;
+        # its own generator keeps seeded layouts as they were
+        probe = _bridson_fill(_PROBE_WELLS, diameter, min_distance, np.random.default_rng(0),
+                              deadline=deadline, num_points=num_points)[1]
+        share = np.mean(probe >= num_points)
+        if share == 0:
+            raise InfeasibleLayoutError(
+                f'could only fit {probe.max()} sites {min_distance:.0f} apart in a {diameter:.0f} wide well, '
+                f'{num_points} requested')
+        if n_wells * (1 - share) ** attempts >= 1:
+            raise InfeasibleLayoutError(
+                f'{num_points} sites {min_distance:.0f} apart fit in only {share:.0%} of tries in a '
+                f'{diameter:.0f} wide well, too few for {n_wells} wells; try fewer sites or a smaller distance')
+
+    local, count = _dart_fill(n_wells, diameter, min_distance, num_points, rng, deadline=deadline)
+    todo = np.flatnonzero(count < num_points)
+    best = 0
+    for _ in range(attempts):
+        if not len(todo):
+            break
+        pts, count = _bridson_fill(len(todo), diameter, min_distance, rng, deadline=deadline, num_points=num_points)
+        done = count >= num_points
+        if not done.all():
+            best = max(best, int(count[~done].max()))
+        # random subset per well: sort random keys with the unused slots pushed to the end
+        keys = rng.random(pts.shape[:2])
+        keys[np.arange(pts.shape[1]) >= count[:, None]] = np.inf
+        pick = np.argsort(keys[done], axis=1)[:, :num_points]
+        local[todo[done]] = np.take_along_axis(pts[done], pick[:, :, None], axis=1)
+        todo = todo[~done]
+    if len(todo):
+        raise InfeasibleLayoutError(
+            f'could only fit {best} sites {min_distance:.0f} apart in a {diameter:.0f} wide well, '
+            f'{num_points} requested')
+
+    return centers[:, None, :] - diameter / 2 + local
+
+
+def grid_pattern(diameter, spacing, num_points):
+    """Deterministic square lattice centred on the well, the num_points sites closest to the center."""
+    n_side = int(np.floor(diameter / spacing)) + 1 if spacing > 0 else 1
+    ticks = (np.arange(n_side) - (n_side - 1) / 2) * spacing
+    xx, yy = np.meshgrid(ticks, ticks)
+    pts = np.column_stack((xx.ravel(), yy.ravel()))
+    if num_points > len(pts):
+        raise InfeasibleLayoutError(
+            f'a {spacing:.0f} grid only has {len(pts)} sites in a {diameter:.0f} wide well, '
+            f'{num_points} requested')
+    order = np.argsort(np.sum(pts * pts, axis=1), kind='stable')
+    return pts[order[:num_points]]
+
+
+def fov_inside_well(pts, diameter, fov):
+    """True for sites whose whole square FOV lies inside the circular well."""
+    far = np.abs(pts) + fov / 2
+    return np.sum(far * far, axis=-1) <= (diameter / 2) ** 2
+
+
+def _best_phase(lattice, diameter, fov):
+    # the lattice is shifted by half a pitch in x/y; keep whichever phase fits the most FOVs
+    best = None
+    for shifted in lattice:
+        keep = shifted[fov_inside_well(shifted, diameter, fov)]
+        if best is None or len(keep) > len(best):
+            best = keep
+    return best
+
+
+def hex_pattern(diameter, fov, overlap=0.0):
+    """Staggered (hexagonal) rows of square FOVs covering the circular well.
+
+    Rows are one pitch apart and every other row is shifted by half a pitch,
+    which is the hexagonal arrangement for square fields. Sites are returned
+    in a row snake so the stage never jumps back across the well.
+    """
+    pitch = fov * (1 - overlap)
+    n = int(np.ceil(diameter / pitch)) + 2
+    ticks = (np.arange(n) - (n - 1) / 2) * pitch
+    xx, yy = np.meshgrid(ticks, ticks)
+    xx = xx + (np.arange(n)[:, None] % 2) * pitch / 2
+    base = np.column_stack((xx.ravel(), yy.ravel()))
+    pts = _best_phase([base, base + [pitch / 2, 0], base + [0, pitch / 2], base + pitch / 2],
+                      diameter, fov)
+    # snake over rows, counted from the lowest one (rounding y / pitch itself merges rows on half pitches)
+    row = np.rint((pts[:, 1] - pts[:, 1].min()) / pitch).astype(int)
+    key = np.where(row % 2 == 0, pts[:, 0], -pts[:, 0])
+    return pts[np.lexsort((key, row))]
+
+
+def _drop_later_clashes(pts, pitch):
+    """pts without every point whose square FOV (side pitch) overlaps that of an earlier one kept."""
+    i, j = close_pairs(pts[:, 0], pts[:, 1], pitch * np.sqrt(2))
+    clash = np.max(np.abs(pts[i] - pts[j]), axis=1) < pitch
+    if not clash.any():
+        return pts
+    i, j = i[clash], j[clash]
+    order = np.argsort(j, kind='stable')
+    keep = np.ones(len(pts), dtype=bool)
+    for a, b in zip(i[order].tolist(), j[order].tolist()):
+        if keep[a]:
+            keep[b] = False
+    return pts[keep]
+
+
+def _clear_of(pts, sites, pitch):
+    """True for points whose square FOV (side pitch) overlaps none of the non-overlapping sites'.
+
+    Non-overlapping sites never share a pitch-sized grid cell, so a dense
+    grid holds one site index per cell and each point needs a single
+    gather of its 3x3 cell neighbourhood.
+    """
+    if not len(sites):
+        return np.ones(len(pts), dtype=bool)
+    lo = sites.min(axis=0)
+    # two cells of padding, so the neighbourhood of a point clipped to the border stays inside
+    cells = np.floor((sites - lo) / pitch).astype(np.intp) + 2
+    nx, ny = cells.max(axis=0) + 3
+    grid = np.full((ny, nx), -1, dtype=np.intp)
+    grid[cells[:, 1], cells[:, 0]] = np.arange(len(sites))
+    pc = np.clip(np.floor((pts - lo) / pitch).astype(np.intp) + 2, 1, (nx - 2, ny - 2))
+    neigh = grid[pc[:, 1, None] + _CELL_DY, pc[:, 0, None] + _CELL_DX]
+    far = np.max(np.abs(sites[np.maximum(neigh, 0)] - pts[:, None]), axis=2) >= pitch
+    return np.all((neigh < 0) | far, axis=1)
+
+
+def _non_overlapping(candidates, pitch, segment):
+    """The candidates, in order, whose square FOV of side pitch clears every earlier one kept.
+
+    Square FOVs overlap when both |dx| and |dy| are under pitch, which a
+    Euclidean spacing does not rule out (diagonal neighbours pitch apart
+    overlap by a lot), so every clash is checked on the two axes.
+
+    The candidates run along rings or spiral half turns, numbered by
+    segment. Per segment, the candidates clashing with the three segments
+    before it are dropped at once, and the rest are walked along the curve,
+    each kept site jumping to the first candidate that clears it; a ring
+    closing on itself is then checked for clashes the walk cannot see.
+    """
+    kept = []
+    for seg in np.split(candidates, np.flatnonzero(np.diff(segment)) + 1):
+        if kept:
+            seg = seg[_clear_of(seg, np.concatenate(kept[-3:]), pitch)]
+        n = len(seg)
+        # first candidate after each one that clears it, or the end of the segment
+        jump = np.full(n, n)
+        todo = np.arange(n)
+        for step in range(1, 4 * _CANDIDATES_PER_PITCH + 1):
+            todo = todo[todo + step < n]
+            if not len(todo):
+                break
+            clear = np.max(np.abs(seg[todo + step] - seg[todo]), axis=1) >= pitch
+            jump[todo[clear]] = todo[clear] + step
+            todo = todo[~clear]
+        else:
+            # no clear candidate close by (a tight turn): take the farthest tried, checked below
+            jump[todo] = todo + step
+        jump = jump.tolist()
+        walk = []
+        k = 0
+        while k < n:
+            walk.append(k)
+            k = jump[k]
+        kept.append(_drop_later_clashes(seg[walk], pitch))
+    return np.concatenate(kept) if kept else np.empty((0, 2))
+
+
+def ring_pattern(diameter, fov, overlap=0.0):
+    """A center site plus concentric rings one pitch apart, walked outwards.
+
+    Each ring is tried at a fine angular step and a site is kept wherever
+    its FOV overlaps no site kept before it, so rings thin out on the
+    diagonals where square FOVs a pitch apart would still overlap.
+    """
+    pitch = fov * (1 - overlap)
+    n_rings = int(np.ceil(diameter / 2 / pitch)) + 1
+    radii = np.arange(1, n_rings) * pitch
+    per_ring = np.ceil(2 * np.pi * radii / pitch * _CANDIDATES_PER_PITCH).astype(int)
+    ring = np.repeat(np.arange(len(radii)), per_ring)
+    k = np.arange(len(ring)) - np.repeat(np.cumsum(per_ring) - per_ring, per_ring)
+    ang = 2 * np.pi * k / per_ring[ring]
+    pts = np.vstack(([0.0, 0.0], np.column_stack((radii[ring] * np.cos(ang), radii[ring] * np.sin(ang)))))
+    inside = fov_inside_well(pts, diameter, fov)
+    return _non_overlapping(pts[inside], pitch, np.concatenate(([-1], ring))[inside])
+
+
+def spiral_pattern(diameter, fov, overlap=0.0):
+    """Sites along an Archimedean spiral whose turns are one pitch apart.
+
+    The spiral is tried at a fine arc-length step and a site is kept
+    wherever its FOV overlaps no site kept before it.
+    """
+    pitch = fov * (1 - overlap)
+    b = pitch / (2 * np.pi)
+    theta_max = diameter / 2 / b + 2 * np.pi
+    theta = np.linspace(0, theta_max, 4096)
+    # arc length of r = b * theta
+    arc = b / 2 * (theta * np.sqrt(1 + theta * theta) + np.arcsinh(theta))
+    # a center site, then the spiral from its first full turn (radius one pitch) outwards
+    start = np.interp(2 * np.pi, theta, arc)
+    t = np.interp(np.arange(start, arc[-1], pitch / _CANDIDATES_PER_PITCH), arc, theta)
+    pts = np.vstack(([0.0, 0.0], np.column_stack((b * t * np.cos(t), b * t * np.sin(t)))))
+    inside = fov_inside_well(pts, diameter, fov)
+    # half turns, so a segment never comes back next to its own start
+    half_turn = np.concatenate(([-1], np.floor(t / np.pi)))
+    return _non_overlapping(pts[inside], pitch, half_turn[inside])
+
+
+_COVERAGE_PATTERNS = {'Hex': hex_pattern, 'Rings': ring_pattern, 'Spiral': spiral_pattern}
+
+
+def max_sites(kind, diameter, fov, overlap=0.0):
+    """How many FOVs of the given layout fit in the well (non-overlapping with the default overlap=0)."""
+    return len(_COVERAGE_PATTERNS[kind](diameter, fov, overlap))
+
+
+def site_pattern(kind, diameter, min_distance, num_points, rng=None, fov=None, overlap=0.0):
+    """One well's worth of sites, relative to the well center, as (num_points, 2).
+
+    Random and Grid keep sites min_distance apart in the diameter-wide square;
+    Hex, Rings and Spiral tile square FOVs of side fov with the given
+    fractional overlap inside the circular well. num_points=None takes every
+    site of a coverage layout, otherwise the ones closest to the center.
+    """
+    if kind == 'Random':
+        return poisson_disk_sites(np.zeros((1, 2)), diameter, min_distance, num_points, rng=rng)[0]
+    if kind == 'Grid':
+        return grid_pattern(diameter, min_distance, num_points)
+    if kind in _COVERAGE_PATTERNS:
+        pts = _COVERAGE_PATTERNS[kind](diameter, fov, overlap)
+        if num_points is None:
+            return pts
+        if num_points > len(pts):
+            raise InfeasibleLayoutError(
+                f'only {len(pts)} FOVs of {fov:.0f} fit in a {diameter:.0f} well with the {kind} layout, '
+                f'{num_points} requested')
+        # innermost sites, kept in the layout's own visiting order
+        keep = np.sort(np.argsort(np.sum(pts * pts, axis=1), kind='stable')[:num_points])
+        return pts[keep]
+    raise ValueError(f'unknown site pattern {kind!r}')
+
+
+def broadcast_pattern(centers, pattern):
+    """Add the same (n, 2) pattern to every well center, giving (len(centers), n, 2)."""
+    centers = np.asarray(centers, dtype=float).reshape(-1, 2)
+    return centers[:, None, :] + np.asarray(pattern, dtype=float)[None, :, :]
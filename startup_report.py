@@ -0,0 +1,105 @@
+"""Import-time report and startup budget check for the three tools.
+
+Each tool is imported in a fresh interpreter with ``python -X importtime``
+and, with --window, also started far enough to show its window. Run it on
+the acquisition PC after changing imports:
+
+    python startup_report.py            # import time per tool, top offenders
+    python startup_report.py --window   # also time until the window is shown
+
+Exits with status 1 when a tool is over its budget.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# seconds; import budget covers `import <tool>`, window budget is interpreter start to first paint
+TOOLS = {
+    'plate_selector_final': {'import': 0.6, 'window': 1.5},
+    'merge': {'import': 0.3, 'window': 1.0},
+    'nd2_roid_selector_pyqt': {'import': 0.6, 'window': 1.5},
+}
+
+_SHOW_WINDOW = {
+    'plate_selector_final': (
+        'from PyQt5.QtWidgets import QApplication; app = QApplication([]); '
+        'import plate_selector_final as m; w = m.WellPlateSelector(); w.show(); app.processEvents()'),
+    'merge': (
+        'import tkinter as tk; root = tk.Tk(); '
+        'import merge as m; m.PointListMergerApp(root); root.update()'),
+    'nd2_roid_selector_pyqt': (
+        'from PyQt5.QtWidgets import QApplication; app = QApplication([]); '
+        'import nd2_roid_selector_pyqt as m; w = m.ROISelector(); w.show(); app.processEvents()'),
+}
+
+
+def import_times(module):
+    """(cumulative us, module) for every module imported by `import module`, slowest first."""
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                          cwd=HERE, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+    rows = []
+    for line in proc.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)
+
+
+def window_time(module):
+    """Wall time from interpreter start until the tool's window has been shown once."""
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, '-c', _SHOW_WINDOW[module]],
+                          cwd=HERE, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+    return time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('tools', nargs='*', default=list(TOOLS), help='tools to check (default: all)')
+    parser.add_argument('--window', action='store_true', help='also time until the window is shown')
+    parser.add_argument('--top', type=int, default=8, help='heaviest top-level packages to list')
+    args = parser.parse_args(argv)
+
+    over = False
+    for module in args.tools:
+        budget = TOOLS[module]
+        try:
+            rows = import_times(module)
+        except RuntimeError as e:
+            print(f'{module}: import failed: {e}')
+            over = True
+            continue
+        total = next(us for us, name in rows if name == module) / 1e6
+        flag = 'OVER' if total > budget['import'] else 'ok'
+        print(f'{module}: import {total:.3f} s (budget {budget["import"]:.1f} s) {flag}')
+        over |= total > budget['import']
+        # only top-level packages, their cumulative time already includes submodules
+        top = [(us, name) for us, name in rows if '.' not in name and name != module][:args.top]
+        for us, name in top:
+            print(f'    {us / 1e6:7.3f} s  {name}')
+
+        if args.window:
+            try:
+                elapsed = window_time(module)
+            except RuntimeError as e:
+                print(f'    window: failed: {e}')
+                over = True
+                continue
+            flag = 'OVER' if elapsed > budget['window'] else 'ok'
+            print(f'    window shown after {elapsed:.3f} s (budget {budget["window"]:.1f} s) {flag}')
+            over |= elapsed > budget['window']
+    return 1 if over else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
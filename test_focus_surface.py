@@ -0,0 +1,32 @@
+import numpy as np
+
+from focus_surface import FocusSurface
+
+
+def test_repeated_focus_position_is_averaged():
+    # a 3x3 grid on a tilted plane, with the centre focused three times
+    gx, gy = np.meshgrid([0.0, 5000.0, 10000.0], [0.0, 4000.0, 8000.0])
+    x, y = gx.ravel(), gy.ravel()
+    z = 100 + 0.001 * x - 0.002 * y
+    x = np.append(x, [5000.0, 5000.0])
+    y = np.append(y, [4000.0, 4000.0])
+    z = np.append(z, [z[4] + 1.0, z[4] - 4.0])
+
+    surface = FocusSurface(x, y, z, kind='tps')
+
+    assert surface.kind == 'tps'
+    assert surface.n_points == 9
+    assert np.isclose(surface(5000.0, 4000.0), z[4] - 1.0)
+    assert np.isclose(surface(0.0, 0.0), 100.0)
+
+
+def test_repeats_count_once_for_auto():
+    x = np.array([0.0, 1000.0, 0.0, 1000.0, 500.0, 500.0])
+    y = np.array([0.0, 0.0, 1000.0, 1000.0, 500.0, 500.0])
+    z = np.array([10.0, 11.0, 12.0, 13.0, 11.5, 11.5])
+
+    surface = FocusSurface(x, y, z)
+
+    # six points but five positions: a plane, not a spline
+    assert surface.kind == 'plane'
+    assert np.allclose(surface(x, y), z)
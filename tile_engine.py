@@ -0,0 +1,106 @@
+"""Tile grids over ROIs for the ROI selector, for all tiles at once.
+
+A ROI's bounding box is covered by a snake-ordered grid of FOV centres,
+and the centres (or sample points spread over each FOV) are tested
+against the exact ROI shape: a rectangle or ellipse of a given size from
+the ROI origin, or a polygon. Points are mapped to ROI coordinates with an
+affine transform, so moved, scaled or rotated ROIs need no rasterised
+mask. Coordinates are image pixels throughout.
+"""
+import numpy as np
+
+KINDS = ('rect', 'ellipse', 'polygon')
+
+# FOV sample points per side for the minimum fraction rule
+SAMPLES = 8
+
+# tiles tested per block, bounds the (tiles x samples) arrays
+_BLOCK = 4096
+
+
+def snake_grid(x0, y0, width, height, step):
+    """Centres of tiles step apart covering a box, centred in it, in snake order.
+
+    Returns (x, y, row, col); col counts along the row in visit order, so
+    on odd rows (which run backwards) col 0 is the rightmost tile.
+    """
+    nx = max(1, int(np.floor(width / step)))
+    ny = max(1, int(np.floor(height / step)))
+    xs = x0 + (width - (nx - 1) * step) / 2 + np.arange(nx) * step
+    ys = y0 + (height - (ny - 1) * step) / 2 + np.arange(ny) * step
+    row, col = np.divmod(np.arange(nx * ny), nx)
+    ix = np.where(row % 2 == 1, nx - 1 - col, col)
+    return xs[ix], ys[row], row, col
+
+
+def row_label(row):
+    """0 -> 'A', ..., 25 -> 'Z', then 'AA', 'AB', ... like spreadsheet columns (tile rows, plate rows)."""
+    label = ''
+    row += 1
+    while row:
+        row, rem = divmod(row - 1, 26)
+        label = chr(ord('A') + rem) + label
+    return label
+
+
+def to_local(transform, x, y):
+    """Points mapped with a 2x3 affine matrix [[a, b, tx], [c, d, ty]]."""
+    m = np.asarray(transform, dtype=float)
+    return m[0, 0] * x + m[0, 1] * y + m[0, 2], m[1, 0] * x + m[1, 1] * y + m[1, 2]
+
+
+def inside(kind, u, v, size=None, vertices=None):
+    """Whether points (ROI coordinates) lie in the shape.
+
+    rect and ellipse fill the box from the origin to size (w, h); polygon
+    uses the even-odd rule over its vertices, an (n, 2) array.
+    """
+    if kind == 'rect':
+        w, h = size
+        return ((u >= min(0, w)) & (u <= max(0, w)) &
+                (v >= min(0, h)) & (v <= max(0, h)))
+    if kind == 'ellipse':
+        rx, ry = size[0] / 2, size[1] / 2
+        if not rx or not ry:
+            return np.zeros(np.shape(u), dtype=bool)
+        return ((u - rx) / rx) ** 2 + ((v - ry) / ry) ** 2 <= 1
+    if kind == 'polygon':
+        vertices = np.asarray(vertices, dtype=float)
+        result = np.zeros(np.shape(u), dtype=bool)
+        for (x1, y1), (x2, y2) in zip(vertices, np.roll(vertices, -1, axis=0)):
+            # edges crossing the horizontal line through each point, left of it
+            crosses = (y1 > v) != (y2 > v)
+            if not crosses.any():
+                continue
+            with np.errstate(divide='ignore', invalid='ignore'):
+                x_cross = x1 + (v - y1) * (x2 - x1) / (y2 - y1)
+            result ^= crosses & (u < x_cross)
+        return result
+    raise ValueError(f'unknown ROI shape {kind!r}, expected one of {KINDS}')
+
+
+def fov_fractions(x, y, fov, transform, kind, size=None, vertices=None, samples=SAMPLES):
+    """Fraction of each square FOV (centres x, y, side fov) inside the shape, from samples x samples points."""
+    offsets = ((np.arange(samples) + 0.5) / samples - 0.5) * fov
+    fractions = np.empty(len(x))
+    for start in range(0, len(x), _BLOCK):
+        bx = x[start:start + _BLOCK, None, None] + offsets[None, None, :]
+        by = y[start:start + _BLOCK, None, None] + offsets[None, :, None]
+        u, v = to_local(transform, bx, by)
+        fractions[start:start + _BLOCK] = inside(kind, u, v, size, vertices).mean(axis=(1, 2))
+    return fractions
+
+
+def roi_tiles(box, step, fov, transform, kind, size=None, vertices=None, min_fraction=0.0):
+    """Tiles of a ROI: (x, y, row, col) of the grid over box (x0, y0, w, h) that are kept.
+
+    With min_fraction 0 a tile is kept when its centre is in the ROI,
+    otherwise when at least that fraction of its FOV is. transform maps
+    image pixels to ROI coordinates.
+    """
+    x, y, row, col = snake_grid(*box, step)
+    if min_fraction > 0:
+        keep = fov_fractions(x, y, fov, transform, kind, size, vertices) >= min_fraction
+    else:
+        keep = inside(kind, *to_local(transform, x, y), size, vertices)
+    return x[keep], y[keep], row[keep], col[keep]
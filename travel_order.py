@@ -0,0 +1,200 @@
+"""Acquisition order with short stage travel.
+
+Points are visited along an open path that starts at a given point: a
+nearest-neighbour path is improved with 2-opt (reverse a stretch) and
+Or-opt (move a run of 1-3 points elsewhere) until neither shortens it.
+Every move is evaluated for all positions at once on a distance matrix.
+
+Groups (wells, ROIs, source files) are finished before the next one is
+entered: groups are ordered by their centroids, then each group's points
+are ordered starting from the point closest to where the previous group
+ended. Large ungrouped lists are split into grid cells the same way, so
+the distance matrices stay small.
+"""
+import numpy as np
+
+# points solved with one distance matrix; larger sets are ordered cell by cell
+MAX_DIRECT = 1000
+
+# Or-opt candidates per point
+NEIGHBOURS = 8
+
+# above this many points Or-opt is skipped: it gains 1-2 % but costs 4x the time
+OR_OPT_LIMIT = 5000
+
+METRICS = ('euclidean', 'chebyshev')
+
+
+def distance_matrix(xy, metric='euclidean'):
+    """(n, n) stage travel between the points of an (n, 2) array.
+
+    'chebyshev' is the larger of the X and Y move, the right measure when
+    both axes move at the same time at the same speed.
+    """
+    diff = np.abs(xy[:, None, :] - xy[None, :, :])
+    if metric == 'chebyshev':
+        return diff.max(axis=2)
+    if metric != 'euclidean':
+        raise ValueError(f'unknown metric {metric!r}, expected one of {METRICS}')
+    return np.hypot(diff[..., 0], diff[..., 1])
+
+
+def travel_length(x, y, order=None, metric='euclidean'):
+    """Total stage travel (um) visiting the points in order (default: as given)."""
+    xy = np.column_stack([x, y]).astype(float)
+    if order is not None:
+        xy = xy[order]
+    if len(xy) < 2:
+        return 0.0
+    step = np.abs(np.diff(xy, axis=0))
+    if metric == 'chebyshev':
+        return float(step.max(axis=1).sum())
+    return float(np.hypot(step[:, 0], step[:, 1]).sum())
+
+
+def _nearest_neighbour(d, start):
+    n = len(d)
+    route = np.empty(n, dtype=np.intp)
+    visited = np.zeros(n, dtype=bool)
+    current = start
+    for k in range(n):
+        route[k] = current
+        visited[current] = True
+        if k == n - 1:
+            break
+        row = np.where(visited, np.inf, d[current])
+        current = int(row.argmin())
+    return route
+
+
+def _two_opt(d, route):
+    # route ends in the virtual end node (zero distance to everything), which
+    # makes reversing the tail of the open path an ordinary 2-opt move
+    n = len(route)
+    improved = False
+    for i in range(n - 3):
+        a, b = route[i], route[i + 1]
+        c = route[i + 2:n - 1]
+        e = route[i + 3:n]
+        # reverse route[i+1 .. j] for every j at once
+        delta = d[a, c] + d[b, e] - d[a, b] - d[c, e]
+        j = int(delta.argmin())
+        if delta[j] < -1e-9:
+            route[i + 1:i + j + 3] = route[i + 1:i + j + 3][::-1].copy()
+            improved = True
+    return improved
+
+
+def _or_opt(d, route, neighbours):
+    # a run is only tried next to the nearest neighbours of its end points,
+    # where nearly all improving moves are
+    n = len(route)
+    pos = np.empty(n, dtype=np.intp)
+    pos[route] = np.arange(n)
+    improved = False
+    for length in (1, 2, 3):
+        s = 1  # position 0 is the fixed start
+        while s + length < n:
+            first, last = route[s], route[s + length - 1]
+            p, q = route[s - 1], route[s + length]
+            gain = d[p, first] + d[last, q] - d[p, q]
+            near = pos[np.concatenate([neighbours[first], neighbours[last]])]
+            k = np.concatenate([near - 1, near])
+            # edges (k, k+1) that exist and do not touch the run
+            k = k[(k >= 0) & (k < n - 1) & ((k < s - 1) | (k >= s + length))]
+            u, v = route[k], route[k + 1]
+            forward = d[u, first] + d[last, v] - d[u, v]
+            backward = d[u, last] + d[first, v] - d[u, v]
+            cost = np.minimum(forward, backward)
+            best = int(cost.argmin()) if len(cost) else 0
+            if len(cost) and cost[best] < gain - 1e-9:
+                piece = route[s:s + length].copy()
+                if backward[best] < forward[best]:
+                    piece = piece[::-1]
+                at = k[best]
+                if at < s:
+                    route[:] = np.concatenate([route[:at + 1], piece, route[at + 1:s], route[s + length:]])
+                else:
+                    route[:] = np.concatenate([route[:s], route[s + length:at + 1], piece, route[at + 1:]])
+                pos[route] = np.arange(n)
+                improved = True
+            else:
+                s += 1
+    return improved
+
+
+def _solve(xy, start, metric, max_passes, or_opt=True):
+    """Indices of an open path through xy starting at start."""
+    n = len(xy)
+    if n <= 2:
+        return np.array([start] + [i for i in range(n) if i != start], dtype=np.intp)
+    d = np.zeros((n + 1, n + 1))
+    d[:n, :n] = distance_matrix(xy, metric)
+    route = np.append(_nearest_neighbour(d[:n, :n], start), n)
+    k = min(NEIGHBOURS, n - 1)
+    neighbours = np.argpartition(d[:n, :n] + np.diag(np.full(n, np.inf)), k - 1, axis=1)[:, :k]
+    for _ in range(max_passes):
+        improved = _two_opt(d, route)
+        if or_opt:
+            improved |= _or_opt(d, route, neighbours)
+        if not improved:
+            break
+    return route[:-1]
+
+
+def _grid_groups(xy, size):
+    # square cells holding about `size` points each
+    span = np.ptp(xy, axis=0).max() or 1.0
+    cells = max(1, int(np.ceil(np.sqrt(len(xy) / size))))
+    cell = (xy - xy.min(axis=0)) // (span / cells + 1e-9)
+    return cell[:, 0] * (cells + 1) + cell[:, 1]
+
+
+def order_points(x, y, groups=None, start=None, metric='euclidean', max_passes=50, or_opt=None):
+    """Visiting order (indices) with short total stage travel.
+
+    groups gives a label per point; all points of a group are visited
+    before the next group. start is the index of the first point (default:
+    the first point given). or_opt defaults to on up to OR_OPT_LIMIT points.
+    """
+    xy = np.column_stack([x, y]).astype(float)
+    n = len(xy)
+    if n == 0:
+        return np.empty(0, dtype=np.intp)
+    first = 0 if start is None else int(start)
+    if or_opt is None:
+        or_opt = n <= OR_OPT_LIMIT
+    if groups is None:
+        if n <= MAX_DIRECT:
+            return _solve(xy, first, metric, max_passes, or_opt)
+        groups = _grid_groups(xy, MAX_DIRECT // 3)
+
+    labels, members = np.unique(np.asarray(groups), return_inverse=True)
+    members = members.ravel()
+    by_group = np.argsort(members, kind='stable')
+    bounds = np.searchsorted(members[by_group], np.arange(len(labels) + 1))
+    centroids = np.array([xy[by_group[bounds[g]:bounds[g + 1]]].mean(axis=0) for g in range(len(labels))])
+
+    group_route = order_points(centroids[:, 0], centroids[:, 1], start=members[first],
+                               metric=metric, max_passes=max_passes, or_opt=or_opt)
+    order = []
+    position = xy[first]
+    for g in group_route:
+        idx = by_group[bounds[g]:bounds[g + 1]]
+        local = xy[idx]
+        # the first group contains the start point, so it is entered there
+        entry = int(np.hypot(*(local - position).T).argmin())
+        if len(idx) > MAX_DIRECT:
+            sub = order_points(local[:, 0], local[:, 1], start=entry, metric=metric, max_passes=max_passes,
+                               or_opt=or_opt)
+        else:
+            sub = _solve(local, entry, metric, max_passes, or_opt)
+        order.append(idx[sub])
+        position = local[sub[-1]]
+    return np.concatenate(order)
+
+
+def order_columns(columns, groups=None, **kwargs):
+    """Pointlist columns reordered by order_points; returns (columns, order)."""
+    order = order_points(columns['x'], columns['y'], groups=groups, **kwargs)
+    return {key: np.asarray(col)[order] for key, col in columns.items()}, order